@@ -0,0 +1,449 @@
+"""Reproduzierbarer Benchmark der Verarbeitungspipeline.
+
+Erzeugt synthetische Eingabebilder (2, 12 und 40 MP als JPEG und PNG), misst
+jede Stufe einzeln (Dekodieren, Vorprüfung, Erkennung, Landmarks, Prüfungen, Zuschnitt,
+JPEG-Suche) sowie den Ende-zu-Ende-Durchlauf über den Flask-Testclient und
+optional einen Lasttest mit mehreren parallelen Clients. Alle Gesichtsdetektoren
+werden auf denselben Bildern nach Laufzeit und Genauigkeit verglichen.
+
+Aufruf:
+    python benchmarks/bench_pipeline.py --output ergebnisse.json
+    python benchmarks/bench_pipeline.py --update-baseline
+    python benchmarks/bench_pipeline.py --threshold 15   # Vergleich mit Baseline, Exit-Code 1 bei Regression
+    python benchmarks/bench_pipeline.py --faces-dir fotos/   # Detektorvergleich mit echten Fotos
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from config import Config  # noqa: E402
+from detectors import BACKENDS  # noqa: E402
+from image_processor import BiometricImageProcessor  # noqa: E402
+from landmarks import Landmarks  # noqa: E402
+from model_registry import get_registry  # noqa: E402
+from pipeline import PROCESSOR_OPTIONS, decode_image  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_SIZES = (2, 12, 40)
+DEFAULT_FORMATS = ("jpg", "png")
+
+
+def synthetic_image(megapixels, seed=0):
+    """Erzeugt ein reproduzierbares Testbild (3:2) mit Verlauf, Formen und Rauschen"""
+    height = int(round((megapixels * 1000000 / 1.5) ** 0.5))
+    width = int(round(height * 1.5))
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), np.uint8)
+    image[..., 0] = (x * 0.6 + y * 0.4).astype(np.uint8)
+    image[..., 1] = (255 - x * 0.5).astype(np.uint8)
+    image[..., 2] = (y * 0.8 + 40).astype(np.uint8)
+    for _ in range(40):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(height // 40, height // 6))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, center, radius, color, -1)
+    noise = rng.integers(-12, 13, image.shape, dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_landmarks(center_x, eye_y, face_height, chin_to_eye_factor=2.2):
+    """Erzeugt 68 frontale Landmarks, die alle biometrischen Prüfungen bestehen.
+
+    face_height entspricht der Gesichtshöhe aus crop_geometry (Abstand Augen–Kinn
+    mal chin_to_eye_factor), damit Zuschnitt und Skalierung realistisch sind.
+    """
+    chin_offset = face_height / chin_to_eye_factor
+    half_width = chin_offset * 0.85
+    points = np.zeros((68, 2), np.float64)
+
+    # Kieferlinie (0-16) als untere Ellipsenhälfte, Punkt 8 ist das Kinn
+    angles = np.linspace(np.pi, 0, 17)
+    points[0:17, 0] = center_x + half_width * np.cos(angles)
+    points[0:17, 1] = eye_y + chin_offset * np.sin(angles)
+
+    eye_dx = half_width * 0.45
+    eye_w = half_width * 0.28
+    eye_h = eye_w * 0.3
+    # Augenbrauen (17-26)
+    for start, side in ((17, -1), (22, 1)):
+        xs = center_x + side * eye_dx + np.linspace(-eye_w, eye_w, 5) * side
+        points[start:start + 5, 0] = xs
+        points[start:start + 5, 1] = eye_y - eye_w * 0.9 - np.sin(np.linspace(0, np.pi, 5)) * eye_h
+    # Nasenrücken (27-30) und Nasenflügel (31-35)
+    points[27:31, 0] = center_x
+    points[27:31, 1] = eye_y + np.linspace(0, chin_offset * 0.45, 4)
+    points[31:36, 0] = center_x + np.linspace(-eye_w * 0.7, eye_w * 0.7, 5)
+    points[31:36, 1] = eye_y + chin_offset * 0.5
+    # Augen (36-41 links, 42-47 rechts): Ecke, zwei oben, Ecke, zwei unten
+    eye_shape = np.array([[-1, 0], [-0.35, -1], [0.35, -1], [1, 0], [0.35, 1], [-0.35, 1]])
+    for start, side in ((36, -1), (42, 1)):
+        points[start:start + 6, 0] = center_x + side * eye_dx + eye_shape[:, 0] * eye_w
+        points[start:start + 6, 1] = eye_y + eye_shape[:, 1] * eye_h
+    # Mund außen (48-59) und innen (60-67), geschlossen
+    mouth_y = eye_y + chin_offset * 0.72
+    outer = np.linspace(np.pi, -np.pi, 12, endpoint=False)
+    points[48:60, 0] = center_x + np.cos(outer) * eye_w * 1.2
+    points[48:60, 1] = mouth_y + np.sin(outer) * eye_h * 1.5
+    inner = np.linspace(np.pi, -np.pi, 8, endpoint=False)
+    points[60:68, 0] = center_x + np.cos(inner) * eye_w
+    points[60:68, 1] = mouth_y + np.sin(inner) * 1.0
+    return Landmarks(points)
+
+
+def _timed(function, repeat, warmup=1):
+    """Führt function aus und gibt die Laufzeiten in Millisekunden zurück"""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        'median_ms': round(statistics.median(ordered), 3),
+        'p90_ms': round(ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))], 3),
+        'min_ms': round(ordered[0], 3),
+        'runs': len(ordered),
+    }
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def bench_stages(processor, inputs, repeat, with_models):
+    """Misst jede Stufe der Pipeline einzeln"""
+    results = {}
+    for name, (image, data) in inputs.items():
+        results[f"decode/{name}"] = _summary(_timed(lambda: decode_image(data, processor), repeat))
+
+    for name, (image, _) in inputs.items():
+        if name.endswith('.png'):
+            # Die Stufen nach dem Dekodieren hängen nicht vom Eingabeformat ab
+            continue
+        label = name.rsplit('.', 1)[0]
+        height, width = image.shape[:2]
+        face_height = height * 0.45
+        landmarks = synthetic_landmarks(width / 2, height * 0.4, face_height, processor.chin_to_eye_factor)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        results[f"proxy/{label}"] = _summary(_timed(lambda: processor.detection_proxy(gray), repeat))
+        proxy = processor.detection_proxy(gray)
+        results[f"precheck/{label}"] = _summary(_timed(lambda: processor.check_image_quality(proxy), repeat))
+
+        if with_models:
+            results[f"detect/{label}"] = _summary(_timed(lambda: processor.detect_faces(gray, proxy=proxy), repeat))
+            import dlib
+            box = dlib.rectangle(int(width * 0.35), int(height * 0.2), int(width * 0.65), int(height * 0.65))
+            results[f"landmarks/{label}"] = _summary(
+                _timed(lambda: Landmarks.from_shape(processor.predictor(gray, box)), repeat))
+
+        results[f"checks/{label}"] = _summary(
+            _timed(lambda: processor.check_biometric_requirements(landmarks), repeat * 20))
+
+        def crop():
+            matrix, _ = processor.crop_geometry(image.shape, landmarks)
+            return processor.render_crop(image, matrix)
+        results[f"crop/{label}"] = _summary(_timed(crop, repeat))
+
+        cropped = crop()
+        results[f"jpeg/{label}"] = _summary(
+            _timed(lambda: processor.encode_jpeg(cropped, processor.max_file_size), repeat))
+    return results
+
+
+def _iou(a, b):
+    """Intersection over Union zweier (links, oben, rechts, unten)-Boxen"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union
+
+
+def load_face_set(faces_dir, inputs):
+    """Bildsatz für den Detektorvergleich: [(Name, Graustufenbild, Referenzboxen oder None)].
+
+    Referenzboxen kommen aus faces_dir/labels.json ({Datei: [[l, o, r, u], ...]});
+    fehlen sie, dient Dlib-HOG in voller Auflösung als Referenz. Die synthetischen
+    Eingaben enthalten kein Gesicht und zählen jede Erkennung als Fehlalarm.
+    """
+    images = [(name, cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), [])
+              for name, (image, _) in inputs.items() if not name.endswith('.png')]
+    if faces_dir:
+        labels_path = Path(faces_dir) / 'labels.json'
+        labels = json.loads(labels_path.read_text(encoding='utf-8')) if labels_path.exists() else {}
+        for path in sorted(Path(faces_dir).iterdir()):
+            if path.suffix.lower() not in ('.jpg', '.jpeg', '.png'):
+                continue
+            gray = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if gray is not None:
+                images.append((path.name, gray, labels.get(path.name)))
+    return images
+
+
+def bench_detectors(models, images, repeat, backends=BACKENDS):
+    """Laufzeit und Genauigkeit (Recall, Precision bei IoU >= 0.5) jedes Detektors auf denselben Bildern"""
+    reference = BiometricImageProcessor(config=Config(), models=models, **PROCESSOR_OPTIONS)
+    truth = []
+    for _, gray, boxes in images:
+        if boxes is None:
+            # Keine Beschriftung: Dlib-HOG auf voller Auflösung als Referenz
+            boxes = [(f.left(), f.top(), f.right(), f.bottom()) for f in reference.detect_faces(gray, 0)]
+        truth.append(boxes)
+
+    results = {}
+    for backend in backends:
+        config = Config()
+        config.set('face_detection', 'backend', backend)
+        try:
+            processor = BiometricImageProcessor(config=config, models=models, **PROCESSOR_OPTIONS)
+        except Exception as e:
+            print(f"Detektor {backend} nicht verfügbar: {e}")
+            continue
+        samples = []
+        matched = detected = expected = 0
+        for (_, gray, _), boxes in zip(images, truth):
+            samples.extend(_timed(lambda: processor.detect_faces(gray), repeat))
+            found = [(f.left(), f.top(), f.right(), f.bottom()) for f in processor.detect_faces(gray)]
+            detected += len(found)
+            expected += len(boxes)
+            unmatched = list(found)
+            for box in boxes:
+                best = max(unmatched, key=lambda f: _iou(box, f), default=None)
+                if best is not None and _iou(box, best) >= 0.5:
+                    matched += 1
+                    unmatched.remove(best)
+        summary = _summary(samples)
+        summary.update(
+            recall=round(matched / expected, 3) if expected else None,
+            precision=round(matched / detected, 3) if detected else None,
+            false_positives=detected - matched,
+            images=len(images))
+        results[f"detector/{backend}"] = summary
+    return results
+
+
+def _flask_client(inputs):
+    import app as flask_app
+    # Ohne Ergebnis-Cache, sonst würden nur Cache-Treffer gemessen
+    flask_app.result_cache = None
+    raise_decode_limits(flask_app.config, inputs)
+    # Die Body-Grenze wird beim Import gesetzt und muss mit den Upload-Grenzen steigen
+    flask_app.app.config['MAX_CONTENT_LENGTH'] = max(
+        flask_app.app.config['MAX_CONTENT_LENGTH'],
+        int((flask_app.config.get('decode', 'max_upload_mb') + 1) * 1024 * 1024))
+    return flask_app.app
+
+
+def raise_decode_limits(config, inputs):
+    """Hebt die Upload-Grenzen an, damit auch große PNG-Eingaben gemessen und nicht mit 413 abgelehnt werden"""
+    largest_mb = max(len(data) for _, data in inputs.values()) / (1024 * 1024)
+    largest_mp = max(image.shape[0] * image.shape[1] for image, _ in inputs.values()) / 1000000
+    config.set('decode', 'max_upload_mb', max(config.get('decode', 'max_upload_mb'), int(largest_mb) + 1))
+    config.set('decode', 'max_megapixels', max(config.get('decode', 'max_megapixels'), int(largest_mp) + 1))
+
+
+def bench_end_to_end(inputs, repeat):
+    """Misst den kompletten Durchlauf über den Flask-Testclient.
+
+    Die synthetischen Bilder enthalten kein Gesicht; gemessen wird daher der
+    Weg bis zur Ablehnung nach der Erkennung (Upload, Dekodieren, Erkennung).
+    """
+    client = _flask_client(inputs).test_client()
+    results = {}
+    for name, (_, data) in inputs.items():
+        def post():
+            response = client.post('/process', data={'file': (_BytesFile(data), name)},
+                                   headers={'Accept': 'image/jpeg'})
+            return response.status_code
+        results[f"e2e/{name}"] = _summary(_timed(post, repeat))
+    return results
+
+
+def bench_load(inputs, workers, requests):
+    """Parallele Clients: Durchsatz sowie p50/p99-Latenz"""
+    flask_app = _flask_client(inputs)
+    payloads = [(name, data) for name, (_, data) in inputs.items()]
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        client = flask_app.test_client()
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            name, data = payloads[index % len(payloads)]
+            start = time.perf_counter()
+            client.post('/process', data={'file': (_BytesFile(data), name)}, headers={'Accept': 'image/jpeg'})
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        f"load/{workers}_workers": {
+            'throughput_rps': round(len(latencies) / elapsed, 3),
+            'p50_ms': round(_percentile(latencies, 0.5), 3),
+            'p99_ms': round(_percentile(latencies, 0.99), 3),
+            'requests': len(latencies),
+        }
+    }
+
+
+class _BytesFile:
+    """Minimales Dateiobjekt für den Flask-Testclient, ohne die Daten zu kopieren"""
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        chunk = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+
+def compare(results, baseline, threshold):
+    """Vergleicht Medianzeiten mit der Baseline; gibt die Regressionen zurück"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric, higher_is_worse in (('median_ms', True), ('p99_ms', True), ('throughput_rps', False)):
+            if metric not in current or metric not in previous or not previous[metric]:
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric] * 100
+            if not higher_is_worse:
+                change = -change
+            if change > threshold:
+                regressions.append((key, metric, previous[metric], current[metric], change))
+    return regressions
+
+
+def build_inputs(sizes, formats):
+    inputs = {}
+    for megapixels in sizes:
+        image = synthetic_image(megapixels, seed=int(megapixels))
+        for fmt in formats:
+            params = [int(cv2.IMWRITE_JPEG_QUALITY), 90] if fmt == 'jpg' else []
+            ok, encoded = cv2.imencode(f'.{fmt}', image, params)
+            if not ok:
+                raise RuntimeError(f"Format {fmt} wird von OpenCV nicht unterstützt")
+            inputs[f"{megapixels}MP.{fmt}"] = (image, encoded.tobytes())
+    return inputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark der Passbild-Pipeline")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="Bildgrößen in Megapixel")
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS, help="Eingabeformate (jpg, png, webp, ...)")
+    parser.add_argument("--repeat", type=int, default=5, help="Messungen pro Stufe")
+    parser.add_argument("--skip-e2e", action="store_true", help="Ende-zu-Ende-Messung über Flask überspringen")
+    parser.add_argument("--load-workers", type=int, nargs="*", default=[], help="Lasttest mit N parallelen Clients")
+    parser.add_argument("--load-requests", type=int, default=40, help="Anzahl Anfragen pro Lasttest")
+    parser.add_argument("--faces-dir", help="Ordner mit Fotos (optional labels.json) für den Detektorvergleich")
+    parser.add_argument("--detectors", nargs="+", default=list(BACKENDS), help="Zu vergleichende Detektoren")
+    parser.add_argument("--output", help="Ergebnisse als JSON speichern")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline-Datei für den Vergleich")
+    parser.add_argument("--update-baseline", action="store_true", help="Ergebnisse als neue Baseline speichern")
+    parser.add_argument("--threshold", type=float, default=15.0, help="Erlaubte Verschlechterung in Prozent")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) if float(s).is_integer() else s for s in args.sizes]
+    inputs = build_inputs(sizes, args.formats)
+
+    try:
+        models = get_registry().load()
+        with_models = True
+    except Exception as e:
+        print(f"Dlib-Modelle nicht verfügbar, Erkennung und Landmarks werden übersprungen: {e}")
+        models, with_models = None, False
+
+    config = Config()
+    raise_decode_limits(config, inputs)
+    processor = BiometricImageProcessor(config=config, models=models or _NoModels(), **PROCESSOR_OPTIONS)
+
+    results = bench_stages(processor, inputs, args.repeat, with_models)
+    if with_models:
+        results.update(bench_detectors(models, load_face_set(args.faces_dir, inputs), args.repeat, args.detectors))
+    if with_models and not args.skip_e2e:
+        results.update(bench_end_to_end(inputs, args.repeat))
+        for workers in args.load_workers:
+            results.update(bench_load(inputs, workers, args.load_requests))
+
+    for key, values in results.items():
+        print(f"{key:28s} " + "  ".join(f"{k}={v}" for k, v in values.items()))
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=4), encoding='utf-8')
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(report, indent=4), encoding='utf-8')
+        print(f"Baseline gespeichert: {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        # Ohne Baseline kann keine Regression erkannt werden, das darf ein CI-Lauf nicht übersehen
+        print(f"WARNUNG: Keine Baseline gefunden: {baseline_path} (mit --update-baseline anlegen)", file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8'))['results']
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, before, after, change in regressions:
+        print(f"REGRESSION {key} {metric}: {before} -> {after} (+{change:.1f}%)")
+    if regressions:
+        return 1
+    print(f"Keine Regression über {args.threshold}% gegenüber {baseline_path}")
+    return 0
+
+
+class _NoModels:
+    """Platzhalter für die Registry, wenn nur modellfreie Stufen gemessen werden"""
+    predictor = None
+    detector = None
+
+
+if __name__ == '__main__':
+    sys.exit(main())
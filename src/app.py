@@ -1,20 +1,167 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, g, render_template, request, jsonify, url_for
+from werkzeug.utils import secure_filename
 from image_processor import BiometricImageProcessor
 from config import Config
-import cv2
-import numpy as np
+from model_registry import get_registry
+from jpeg_encoder import JpegSizeError
+from pipeline import PROCESSOR_OPTIONS, PipelineError, process_group, process_profiles, process_upload
+from cache import ResultCache
+from metrics import family_lines, get_metrics, server_timing_header
+from jobs import JobManager, QueueFullError, DONE, FAILED
+from sessions import SessionStore, create_session
+from pathlib import Path
 import base64
+import logging
+import time
+import json
+import shutil
+import tempfile
+import uuid
+import zipfile
 import dlib
 
 app = Flask(__name__)
 config = Config()
+# Obergrenze für jeden Request-Body, auch ohne Content-Length (chunked); die einzelnen
+# Endpunkte prüfen zusätzlich ihre eigene Grenze. 1 MB Reserve für die Multipart-Kodierung.
+app.config['MAX_CONTENT_LENGTH'] = int(
+    (max(config.get('decode', 'max_upload_mb'), config.get('decode', 'max_batch_mb')) + 1) * 1024 * 1024)
+# Dlib-Modelle einmal pro Prozess laden, damit Anfragen sie nur noch wiederverwenden
+models = get_registry()
+models.preload()
+# Ergebnis-Cache für wiederholte Uploads (None, wenn in der Konfiguration deaktiviert)
+result_cache = ResultCache.from_config(config)
+
+# Interaktive Anpassungssitzungen mit dekodiertem Bild und Landmarks
+session_store = SessionStore.from_config(config)
+
+# Zeitmessung der Verarbeitungsstufen
+metrics = get_metrics()
+metrics.enabled = bool(config.get('metrics', 'enabled'))
+
+def _collect_runtime_metrics():
+    # Cache- und Warteschlangenzustand als zusätzliche Prometheus-Zeilen, jede Familie als eigener Block
+    lines = family_lines('passbild_job_queue_depth', 'gauge', 'Wartende Aufträge in der Job-Warteschlange',
+                         [({}, job_manager.stats()['queue_depth'])])
+    lines += family_lines('passbild_sessions', 'gauge', 'Offene Anpassungssitzungen',
+                          [({}, session_store.stats()['sessions'])])
+    if result_cache is not None:
+        tiers = [(tier, stats) for tier, stats in result_cache.stats().items() if stats is not None]
+        lines += family_lines('passbild_cache_hits_total', 'counter', 'Treffer des Ergebnis-Caches nach Ebene',
+                              [({'tier': tier}, stats['hits']) for tier, stats in tiers])
+        lines += family_lines('passbild_cache_misses_total', 'counter', 'Fehlzugriffe des Ergebnis-Caches nach Ebene',
+                              [({'tier': tier}, stats['misses']) for tier, stats in tiers])
+    return lines
+
+metrics.add_collector(_collect_runtime_metrics)
+
+@app.before_request
+def _start_request_timing():
+    g.request_start = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+
+@app.after_request
+def _finish_request_timing(response):
+    if metrics.enabled:
+        metrics.observe('passbild_request_seconds', time.perf_counter() - g.request_start,
+                        endpoint=request.endpoint or 'unknown')
+        timings = metrics.current_timings()
+        if timings and config.get('metrics', 'server_timing'):
+            response.headers['Server-Timing'] = server_timing_header(timings)
+    return response
+
+@app.teardown_request
+def _reset_request_timing(exc):
+    metrics.finish_request(g.pop('metrics_token', None))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus-Textformat
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/ready')
+def ready():
+    # Bereitschaftsprüfung für den Load Balancer: nur warme Worker bekommen Anfragen
+    status = models.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+@app.route('/cache/stats')
+def cache_stats():
+    # Treffer- und Fehlzähler des Ergebnis-Caches
+    if result_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
+def _create_processor():
+    """Leichtgewichtiger Prozessor pro Anfrage, die Modelle kommen aus der Registry"""
+    return BiometricImageProcessor(config=config, models=models, **PROCESSOR_OPTIONS)
+
+# Asynchrone Aufträge: feste Anzahl Worker mit vorab geladenen Modellen und begrenzter Warteschlange
+job_manager = JobManager(
+    lambda data: process_upload(_create_processor(), data, result_cache),
+    workers=int(config.get('jobs', 'workers')),
+    max_queue=int(config.get('jobs', 'max_queue')),
+    result_ttl=config.get('jobs', 'result_ttl'),
+    on_start=models.load)
+
+def _profile_processor(name):
+    """Prozessor für ein Ausgabeprofil aus der Konfiguration (KeyError, wenn unbekannt)"""
+    profile = config.profile(name)
+    options = dict(PROCESSOR_OPTIONS, target_size=profile.target_size, max_file_size=profile.max_file_size)
+    return BiometricImageProcessor(config=profile, models=models, **options)
+
+def _error_details(e):
+    """Übersetzt eine Ausnahme der Verarbeitung in Fehlermeldung und HTTP-Status (ohne Nebenwirkungen)"""
+    if isinstance(e, PipelineError):
+        return str(e), e.status
+    if isinstance(e, JpegSizeError):
+        return str(e), 422
+    if isinstance(e, (FileNotFoundError, getattr(dlib, 'error', ()))):
+        return f'Dlib model error. Make sure shape_predictor_68_face_landmarks.dat is in the src/ directory. Details: {e}', 500
+    return f'An unexpected error occurred: {e}', 500
+
+def _result_headers(result):
+    """Metadaten der Verarbeitung als HTTP-Header"""
+    return {
+        'X-Applied-Scale': f'{result.scale:.6f}',
+        'X-JPEG-Quality': str(result.quality),
+        'X-Encode-Attempts': str(result.attempts),
+    }
+
+def _wants_jpeg():
+    # Content Negotiation: JSON bleibt Standard (auch für Accept: */*), JPEG nur auf ausdrücklichen Wunsch
+    return request.accept_mimetypes.best_match(['application/json', 'image/jpeg']) == 'image/jpeg'
+
+def _upload_too_large(key='max_upload_mb'):
+    # Zu große Uploads ablehnen, bevor der Request-Body gelesen wird (Grenze aus dem Abschnitt 'decode')
+    limit = config.get('decode', key) * 1024 * 1024
+    return request.content_length is not None and request.content_length > limit
+
+@app.errorhandler(413)
+def _request_too_large(e):
+    # Überschreitung von MAX_CONTENT_LENGTH beim Lesen des Bodies (z.B. ohne Content-Length)
+    return jsonify({'error': 'Upload too large'}), 413
+
+def _result_response(result, **extra):
+    """Antwort für ein fertiges Ergebnis: rohes JPEG oder JSON mit Data-URL"""
+    if _wants_jpeg():
+        # Rohe JPEG-Bytes ohne Base64-Umweg, Metadaten in den Headern
+        return Response(result.buffer.tobytes(), mimetype='image/jpeg', headers=_result_headers(result))
+
+    img_str = base64.b64encode(result.buffer).decode('utf-8')
+
+    return jsonify(dict(extra, success=True, image=f'data:image/jpeg;base64,{img_str}',
+                        jpeg_quality=result.quality, encode_attempts=result.attempts,
+                        scale=result.scale))
+
 @app.route('/process', methods=['POST'])
 def process_image_endpoint():
+    if _upload_too_large():
+        return jsonify({'error': 'Upload too large'}), 413
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     file = request.files['file']
@@ -22,53 +169,292 @@ def process_image_endpoint():
         return jsonify({'error': 'No selected file'}), 400
     if file:
         try:
-            in_memory_file = file.read()
-            file_bytes = np.frombuffer(in_memory_file, np.uint8)
-            image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            if image is None:
-                return jsonify({'error': 'Could not decode image'}), 400
+            processor = _create_processor()
+            result = process_upload(processor, file.read(), result_cache)
+        except Exception as e:
+            message, status = _error_details(e)
+            return jsonify({'error': message}), status
 
-            processor = BiometricImageProcessor(
-                target_size=(413, 531),
-                max_file_size=500 * 1024,
-                config=config,
-                debug_mode=False,
-                auto_rotate=True,
-                scal_check=False,
-                eye_check=True,
-                mouth_check=False,
-                side_ratio_check=True,
-                head_tilt_check=True
-            )
+        return _result_response(result)
 
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            faces = processor.detector(gray, 1)
+    return jsonify({'error': 'Something went wrong'}), 500
 
-            if len(faces) == 0:
-                return jsonify({'error': 'No face detected'}), 400
+def _multipart_part(boundary, headers, body):
+    """Ein Teil einer multipart/mixed-Antwort"""
+    head = ''.join(f'{key}: {value}\r\n' for key, value in headers.items())
+    return f'--{boundary}\r\n{head}\r\n'.encode('utf-8') + body + b'\r\n'
 
-            face = faces[0]
-            shape = processor.predictor(gray, face)
+def _spool(upload):
+    """Kopiert einen Upload in eine eigene temporäre Datei, die das Ende der View überdauert"""
+    spooled = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload.stream, spooled)
+    spooled.seek(0)
+    return spooled
 
-            is_valid, message = processor.check_biometric_requirements(shape)
-            if not is_valid:
-                return jsonify({'error': f'Biometric check failed: {message}'}), 400
+@app.route('/process/batch', methods=['POST'])
+def process_batch_endpoint():
+    """Verarbeitet mehrere Dateien (Feld 'files') und streamt jedes Ergebnis als multipart/mixed-Teil"""
+    if _upload_too_large('max_batch_mb'):
+        return jsonify({'error': 'Upload too large'}), 413
+    # Uploads werden beim Ende der View geschlossen; statt alle Dateien in den Speicher zu lesen,
+    # liegen sie bis zur Verarbeitung in eigenen temporären Dateien
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({'error': 'No file part'}), 400
+    try:
+        processor = _create_processor()
+    except Exception as e:
+        message, status = _error_details(e)
+        return jsonify({'error': message}), status
+    uploads = [(f.filename, _spool(f)) for f in files]
 
-            processed_image = processor.process_image(image, shape)
+    boundary = uuid.uuid4().hex
 
-            encoded_img_bytes = processor.adjust_jpeg_quality(processed_image, processor.max_file_size)
+    def generate():
+        try:
+            yield from _generate_parts()
+        finally:
+            # Bei abgebrochener Antwort die restlichen temporären Dateien schließen
+            for _, spooled in uploads:
+                spooled.close()
 
-            img_str = base64.b64encode(encoded_img_bytes).decode('utf-8')
+    def _generate_parts():
+        while uploads:
+            filename, spooled = uploads.pop(0)
+            name = secure_filename(filename) or 'upload'
+            try:
+                with spooled:
+                    data = spooled.read()
+                result = process_upload(processor, data, result_cache)
+            except Exception as e:
+                message, status = _error_details(e)
+                headers = {'Content-Type': 'application/json', 'X-Status': str(status),
+                           'Content-Disposition': f'attachment; filename="{Path(name).stem}.json"'}
+                body = json.dumps({'file': name, 'error': message}, ensure_ascii=False).encode('utf-8')
+            else:
+                headers = {'Content-Type': 'image/jpeg', 'X-Status': '200',
+                           'Content-Disposition': f'attachment; filename="{Path(name).stem}.jpg"'}
+                headers.update(_result_headers(result))
+                body = result.buffer.tobytes()
+            # Upload-Puffer sofort freigeben
+            data = None
+            yield _multipart_part(boundary, headers, body)
+        yield f'--{boundary}--\r\n'.encode('utf-8')
 
-            return jsonify({'success': True, 'image': f'data:image/jpeg;base64,{img_str}'})
+    return Response(generate(), mimetype=f'multipart/mixed; boundary={boundary}')
 
-        except dlib.error as e:
-             return jsonify({'error': f'Dlib model error. Make sure shape_predictor_68_face_landmarks.dat is in the src/ directory. Details: {e}'}), 500
-        except Exception as e:
-            return jsonify({'error': f'An unexpected error occurred: {e}'}), 500
+def _group_face_info(face):
+    """Beschreibung eines Gesichts im Gruppenfoto ohne Bilddaten"""
+    info = {'face': face.index + 1, 'box': list(face.box), 'success': face.valid, 'message': face.message}
+    if face.result is not None:
+        info.update(filename=f'face_{face.index + 1:03d}.jpg', jpeg_quality=face.result.quality,
+                    encode_attempts=face.result.attempts, scale=face.result.scale)
+    if face.error is not None:
+        info['error'], info['status'] = _error_details(face.error)
+    return info
 
-    return jsonify({'error': 'Something went wrong'}), 500
+class _ChunkWriter:
+    """Nicht suchbarer Schreibpuffer, aus dem ein ZIP-Archiv stückweise gestreamt wird"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+@app.route('/process/group', methods=['POST'])
+def process_group_endpoint():
+    """Verarbeitet jedes Gesicht eines Gruppenfotos (Feld 'file'); mit Accept: application/zip als ZIP-Archiv"""
+    if _upload_too_large():
+        return jsonify({'error': 'Upload too large'}), 413
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+    try:
+        faces = process_group(_create_processor(), file.read())
+    except Exception as e:
+        message, status = _error_details(e)
+        return jsonify({'error': message}), status
+
+    if request.accept_mimetypes.best_match(['application/json', 'application/zip']) != 'application/zip':
+        infos = []
+        for face in faces:
+            info = _group_face_info(face)
+            if face.result is not None:
+                info['image'] = f'data:image/jpeg;base64,{base64.b64encode(face.result.buffer).decode("utf-8")}'
+            infos.append(info)
+        return jsonify({'success': any(face.valid for face in faces), 'faces': infos})
+
+    stem = Path(secure_filename(file.filename) or 'upload').stem
+
+    def generate():
+        # JPEGs sind bereits komprimiert, daher ohne weitere Kompression speichern
+        writer = _ChunkWriter()
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for face in faces:
+                if face.result is not None:
+                    archive.writestr(f'face_{face.index + 1:03d}.jpg', face.result.buffer.tobytes())
+                    yield writer.drain()
+            manifest = [_group_face_info(face) for face in faces]
+            archive.writestr('faces.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        yield writer.drain()
+
+    return Response(generate(), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{stem}_faces.zip"'})
+
+@app.route('/profiles')
+def list_profiles():
+    # Verfügbare Ausgabeprofile mit Zielgröße und Dateigröße
+    profiles = (config.profile(name) for name in config.profile_names())
+    return jsonify({p.name: {'target_size': list(p.target_size), 'max_file_size': p.max_file_size} for p in profiles})
+
+@app.route('/process/profiles', methods=['POST'])
+def process_profiles_endpoint():
+    """Rendert ein Foto (Feld 'file') in mehreren Ausgabeprofilen (Feld 'profiles', Standard: alle)"""
+    if _upload_too_large():
+        return jsonify({'error': 'Upload too large'}), 413
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+    names = [n.strip() for value in request.form.getlist('profiles') for n in value.split(',') if n.strip()]
+    names = list(dict.fromkeys(names)) or config.profile_names()
+    unknown = [name for name in names if name not in config.profile_names()]
+    if unknown:
+        return jsonify({'error': f'Unknown profile: {unknown[0]}'}), 400
+
+    try:
+        # Prozessoren innerhalb des try, damit Modell- und Detektorfehler als JSON zurückkommen
+        processors = {name: _profile_processor(name) for name in names}
+        results = process_profiles(processors, file.read(), result_cache)
+    except Exception as e:
+        message, status = _error_details(e)
+        return jsonify({'error': message}), status
+
+    if request.accept_mimetypes.best_match(['application/json', 'multipart/mixed']) == 'multipart/mixed':
+        # Jede Variante als eigener Teil mit rohen JPEG-Bytes
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, result in results.items():
+            if isinstance(result, Exception):
+                message, status = _error_details(result)
+                headers = {'Content-Type': 'application/json', 'X-Status': str(status), 'X-Profile': name}
+                body = json.dumps({'profile': name, 'error': message}, ensure_ascii=False).encode('utf-8')
+            else:
+                headers = {'Content-Type': 'image/jpeg', 'X-Status': '200', 'X-Profile': name,
+                           'Content-Disposition': f'attachment; filename="{name}.jpg"'}
+                headers.update(_result_headers(result))
+                body = result.buffer.tobytes()
+            parts.append(_multipart_part(boundary, headers, body))
+        parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+        return Response(b''.join(parts), mimetype=f'multipart/mixed; boundary={boundary}')
+
+    variants = {}
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            message, status = _error_details(result)
+            variants[name] = {'success': False, 'error': message, 'status': status}
+        else:
+            img_str = base64.b64encode(result.buffer).decode('utf-8')
+            variants[name] = {'success': True, 'image': f'data:image/jpeg;base64,{img_str}',
+                              'jpeg_quality': result.quality, 'encode_attempts': result.attempts,
+                              'scale': result.scale}
+    return jsonify({'success': any(v['success'] for v in variants.values()), 'profiles': variants})
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Nimmt ein Foto an und gibt sofort eine Auftrags-ID zurück"""
+    if _upload_too_large():
+        return jsonify({'error': 'Upload too large'}), 413
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+    try:
+        job = job_manager.submit(file.read())
+    except QueueFullError as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    status_url = url_for('job_status', job_id=job.id)
+    return jsonify(dict(job.to_dict(), status_url=status_url)), 202, {'Location': status_url}
+
+@app.route('/jobs/stats')
+def job_stats():
+    # Warteschlangenlänge sowie Warte- und Bearbeitungszeiten
+    return jsonify(job_manager.stats())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Status eines Auftrags; nach Abschluss mit Ergebnis oder Fehlermeldung"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job.status == DONE:
+        return _result_response(job.result, **job.to_dict())
+    if job.status == FAILED:
+        message, status = _error_details(job.error)
+        return jsonify(dict(job.to_dict(), error=message, error_status=status))
+    return jsonify(job.to_dict())
+
+@app.route('/sessions', methods=['POST'])
+def create_session_endpoint():
+    """Legt eine Anpassungssitzung an; Dekodieren und Gesichtserkennung laufen nur hier"""
+    if _upload_too_large():
+        return jsonify({'error': 'Upload too large'}), 413
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': 'No file part'}), 400
+    try:
+        session = create_session(session_store, _create_processor(), file.read())
+    except Exception as e:
+        message, status = _error_details(e)
+        return jsonify({'error': message}), status
+    return jsonify({'session_id': session.id, 'expires_in': session_store.ttl,
+                    'adjustments': session.adjustments()}), 201
+
+def _render_session(session_id, preview):
+    """Wendet die Anpassung aus dem JSON-Body an und rendert die Sitzung"""
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown session'}), 404
+    body = request.get_json(silent=True) or {}
+    try:
+        processor = _create_processor()
+        with session.lock:
+            session.apply_keys(processor, body.get('keys', []))
+            session.set_adjustments(body.get('scale_override'), body.get('offset_x'),
+                                    body.get('offset_y'), body.get('rotation_angle'))
+            result = session.render(processor, preview=preview,
+                                    preview_quality=config.get('sessions', 'preview_quality'))
+            adjustments = session.adjustments()
+    except Exception as e:
+        message, status = _error_details(e)
+        return jsonify({'error': message}), status
+    return _result_response(result, session_id=session.id, preview=preview, adjustments=adjustments)
+
+@app.route('/sessions/<session_id>/adjust', methods=['POST'])
+def adjust_session(session_id):
+    # Schnelle Vorschau: nur das Ausgabefenster aus der passenden Pyramidenstufe
+    return _render_session(session_id, preview=True)
+
+@app.route('/sessions/<session_id>/save', methods=['POST'])
+def save_session(session_id):
+    # Volle Qualität wie /process, mit der aktuellen Anpassung
+    return _render_session(session_id, preview=False)
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not session_store.remove(session_id):
+        return jsonify({'error': 'Unknown session'}), 404
+    return '', 204
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     app.run(debug=True)
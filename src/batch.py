@@ -0,0 +1,185 @@
+"""Verarbeitung ganzer Ordner mit mehreren Prozessen.
+
+Aufruf:
+    python src/batch.py EINGABEORDNER AUSGABEORDNER [--workers N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import cv2
+
+from config import Config
+from image_processor import BiometricImageProcessor
+from jpeg_encoder import JpegSizeError
+from model_registry import get_registry
+from pipeline import PROCESSOR_OPTIONS, PipelineError, decode_image, locate_face, run_pipeline
+
+# Unterstützte Eingabeformate
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+# Protokoll abgelehnter Bilder (JSON Lines) im Ausgabeordner
+REJECTED_LOG = "rejected.jsonl"
+
+# Prozessor des Worker-Prozesses, wird einmal pro Prozess angelegt
+_worker_processor = None
+
+
+def output_path_for(source, output_dir, name_extension=""):
+    """Pfad des fertigen Passbildes für eine Eingabedatei.
+
+    Die Endung der Quelle bleibt im Namen (a.png -> a_png.jpg), damit a.jpg und
+    a.png nicht auf dieselbe Ausgabe abgebildet werden und sich überschreiben.
+    """
+    source = Path(source)
+    return Path(output_dir) / f"{name_extension}{source.stem}_{source.suffix[1:]}.jpg"
+
+
+def load_rejected(log_path):
+    """Liest die Namen bereits abgelehnter Dateien aus dem Protokoll"""
+    rejected = set()
+    if Path(log_path).exists():
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    rejected.add(json.loads(line)['file'])
+                except (ValueError, KeyError):
+                    # Unvollständige Zeile nach Abbruch ignorieren
+                    continue
+    return rejected
+
+
+def iter_pending(input_dir, output_dir, name_extension="", skip=()):
+    """Liefert (Quelle, Ziel) für alle Bilder ohne vorhandene Ausgabe, ohne den Ordner vorab komplett zu laden"""
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or Path(entry.name).suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            if entry.name in skip:
+                continue
+            target = output_path_for(entry.name, output_dir, name_extension)
+            if target.exists():
+                continue
+            yield entry.path, str(target)
+
+
+def _init_worker(options):
+    """Lädt Konfiguration und Dlib-Modelle einmal pro Worker-Prozess"""
+    global _worker_processor
+    # Ein Thread pro Prozess, die Parallelität kommt aus dem Prozess-Pool
+    cv2.setNumThreads(1)
+    _worker_processor = BiometricImageProcessor(config=Config(), models=get_registry().load(), **options)
+
+
+def _process_file(source, target):
+    """Verarbeitet eine Datei im Worker und schreibt das Ergebnis atomar"""
+    try:
+        with open(source, 'rb') as f:
+            data = f.read()
+        decoded, landmarks = locate_face(_worker_processor, data, decode_image(data, _worker_processor))
+        result = run_pipeline(_worker_processor, decoded.image, decoded.reduction, landmarks)
+    except PipelineError as e:
+        return source, False, e.reason
+    except JpegSizeError as e:
+        return source, False, str(e)
+    except Exception as e:
+        return source, False, f"Fehler bei der Verarbeitung: {e}"
+
+    # Erst in temporäre Datei schreiben, damit ein Abbruch keine halbe Ausgabe hinterlässt
+    partial = target + ".part"
+    try:
+        with open(partial, 'wb') as f:
+            f.write(result.buffer.tobytes())
+        os.replace(partial, target)
+    except OSError as e:
+        # Schreibfehler betreffen nur diese Datei und dürfen den Lauf nicht abbrechen
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        return source, False, f"Fehler beim Schreiben: {e}"
+    return source, True, "OK"
+
+
+def process_folder(input_dir, output_dir, workers=None, retry_rejected=False, **options):
+    """Verarbeitet alle Bilder eines Ordners parallel und liefert die Ergebnisse, sobald sie fertig sind.
+
+    Bereits vorhandene Ausgaben (und ohne retry_rejected auch protokollierte
+    Ablehnungen) werden übersprungen, sodass ein abgebrochener Lauf fortgesetzt
+    werden kann. Liefert Tupel (Quelle, erfolgreich, Meldung).
+    """
+    processor_options = dict(PROCESSOR_OPTIONS)
+    processor_options.update(options)
+    name_extension = processor_options.get('name_extension', "")
+    workers = workers or os.cpu_count() or 1
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    log_path = Path(output_dir) / REJECTED_LOG
+    skip = set() if retry_rejected else load_rejected(log_path)
+    pending = iter_pending(input_dir, output_dir, name_extension, skip)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(processor_options,)) as pool, \
+            open(log_path, 'a', encoding='utf-8') as log:
+        in_flight = set()
+        exhausted = False
+        while True:
+            # Nur begrenzt viele Aufträge gleichzeitig einreichen, damit große Ordner gestreamt werden
+            while not exhausted and len(in_flight) < workers * 2:
+                try:
+                    source, target = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight.add(pool.submit(_process_file, source, target))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, ok, message = future.result()
+                if not ok:
+                    log.write(json.dumps({'file': Path(source).name, 'error': message}, ensure_ascii=False) + "\n")
+                    log.flush()
+                yield source, ok, message
+
+
+def main(argv=None):
+    config = Config()
+    parser = argparse.ArgumentParser(description="Verarbeitet alle Fotos eines Ordners zu biometrischen Passbildern")
+    parser.add_argument("input_dir", help="Ordner mit den Eingabefotos")
+    parser.add_argument("output_dir", help="Zielordner für die Passbilder")
+    parser.add_argument("--workers", type=int, default=None, help="Anzahl Worker-Prozesse (Standard: Anzahl CPU-Kerne)")
+    parser.add_argument("--width", type=int, default=PROCESSOR_OPTIONS['target_size'][0], help="Zielbreite in Pixel")
+    parser.add_argument("--height", type=int, default=PROCESSOR_OPTIONS['target_size'][1], help="Zielhöhe in Pixel")
+    parser.add_argument("--max-file-size", type=int, default=PROCESSOR_OPTIONS['max_file_size'] // 1024,
+                        help="Maximale Dateigröße in KB")
+    parser.add_argument("--name-extension", default=config.get('biometric_checks', 'name_extension'),
+                        help="Präfix für Dateinamen")
+    parser.add_argument("--retry-rejected", action="store_true",
+                        help="Bereits abgelehnte Bilder erneut verarbeiten")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    processed = rejected = 0
+    for source, ok, message in process_folder(
+            args.input_dir, args.output_dir, workers=args.workers, retry_rejected=args.retry_rejected,
+            target_size=(args.width, args.height), max_file_size=args.max_file_size * 1024,
+            name_extension=args.name_extension):
+        if ok:
+            processed += 1
+        else:
+            rejected += 1
+            print(f"Abgelehnt: {Path(source).name}: {message}")
+
+    elapsed = time.perf_counter() - start
+    total = processed + rejected
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"{processed} verarbeitet, {rejected} abgelehnt in {elapsed:.1f}s ({rate:.1f} Bilder/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(data):
+    """Inhaltsadresse der Upload-Daten"""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def _fingerprint(values):
+    """Stabiler Hash für JSON-serialisierbare Einstellungen"""
+    encoded = json.dumps(values, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=12).hexdigest()
+
+
+def settings_fingerprint(processor):
+    """Fingerabdruck aller Einstellungen, die das fertige Passbild beeinflussen"""
+    return _fingerprint({
+        'target_size': list(processor.target_size),
+        'max_file_size': processor.max_file_size,
+        'checks': [processor.scal_check, processor.eye_check, processor.mouth_check,
+                   processor.side_ratio_check, processor.head_tilt_check],
+        'settings': processor.config.settings,
+    })
+
+
+def detection_fingerprint(processor, reduction):
+    """Fingerabdruck der Einstellungen, die Gesichtserkennung und Landmarks beeinflussen"""
+    return _fingerprint({
+        'face_detection': processor.config.settings.get('face_detection'),
+        'reduction': reduction,
+    })
+
+
+class LRUCache:
+    """Threadsicherer LRU-Cache im Speicher, begrenzt auf Anzahl Einträge und Bytes"""
+
+    def __init__(self, max_entries=256, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=0):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            # Älteste Einträge verdrängen
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+
+class DiskCache:
+    """Cache-Ebene auf der Festplatte mit Verdrängung der am längsten ungenutzten Dateien.
+
+    Ein Eintrag ist eine Datei aus einer Zeile JSON-Metadaten und den
+    Nutzdaten (JPEG-Bytes); gelesen wird nur JSON, kein Pickle. Lese- und
+    Schreibfehler gelten als Fehlzugriff und erreichen die Anfrage nicht.
+    max_bytes wird pro Prozess gezählt; schreiben mehrere Prozesse in dasselbe
+    Verzeichnis, wird die Größe beim Verdrängen neu aus dem Verzeichnis bestimmt.
+    """
+
+    suffix = '.entry'
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Dateigrößen in Zugriffsreihenfolge (älteste zuerst)
+        self._sizes = OrderedDict()
+        self._bytes = 0
+        self._scan()
+
+    def _path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def _scan(self):
+        # Größen aus dem Verzeichnis neu bestimmen (Aufruf mit Lock oder im Konstruktor)
+        entries = []
+        for path in self.directory.glob(f'*{self.suffix}'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        self._sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self._bytes = sum(self._sizes.values())
+
+    def get(self, key):
+        """Gibt (Metadaten, Nutzdaten) zurück oder None (fehlend oder unlesbar)"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header, payload = f.read().split(b'\n', 1)
+            meta = json.loads(header)
+            if not isinstance(meta, dict):
+                raise ValueError('metadata is not an object')
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Unlesbarer Cache-Eintrag %s: %s", path, e)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+        try:
+            # Zugriffszeit für die Verdrängung nach einem Neustart merken
+            os.utime(path)
+        except OSError:
+            pass
+        return meta, payload
+
+    def put(self, key, meta, payload):
+        """Speichert einen Eintrag; ein Schreibfehler wird protokolliert und ignoriert"""
+        data = json.dumps(meta).encode('utf-8') + b'\n' + bytes(payload)
+        partial = None
+        try:
+            # Eigene temporäre Datei je Schreiber, damit gleichzeitige Schreiber sich nicht stören
+            fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(partial, self._path(key))
+        except OSError as e:
+            logger.warning("Cache-Eintrag %s nicht gespeichert: %s", key, e)
+            if partial is not None:
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+            return
+        with self._lock:
+            self._bytes += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            if self._bytes > self.max_bytes:
+                # Andere Prozesse können ebenfalls geschrieben oder verdrängt haben
+                self._scan()
+            while self._sizes and self._bytes > self.max_bytes:
+                evicted, size = self._sizes.popitem(last=False)
+                self._bytes -= size
+                try:
+                    os.remove(self._path(evicted))
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._sizes), 'bytes': self._bytes}
+
+
+class ResultCache:
+    """Ergebnis-Cache nach Bild-Hash und Einstellungen, mit eigenem Cache für Erkennung und Landmarks.
+
+    Ergebnisse liegen im Speicher (LRU) und optional auf der Festplatte. Der
+    Erkennungs-Cache hängt nur vom Bild und den Erkennungseinstellungen ab, sodass
+    bei geänderten Ausgabeeinstellungen die Dlib-Stufe übersprungen wird.
+    """
+
+    def __init__(self, memory_entries=256, memory_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_bytes=512 * 1024 * 1024, detection_entries=1024):
+        self.memory = LRUCache(memory_entries, memory_bytes)
+        self.disk = DiskCache(disk_dir, disk_bytes) if disk_dir else None
+        self.detections = LRUCache(detection_entries)
+
+    @classmethod
+    def from_config(cls, config):
+        """Erzeugt den Cache aus dem Abschnitt 'cache' der Konfiguration (None, wenn deaktiviert)"""
+        if not config.get('cache', 'enabled'):
+            return None
+        return cls(
+            memory_entries=int(config.get('cache', 'memory_entries')),
+            memory_bytes=int(config.get('cache', 'memory_mb') * 1024 * 1024),
+            disk_dir=config.get('cache', 'disk_dir') or None,
+            disk_bytes=int(config.get('cache', 'disk_mb') * 1024 * 1024),
+            detection_entries=int(config.get('cache', 'detection_entries')),
+        )
+
+    def result_key(self, image_hash, processor):
+        return f"{image_hash}-{settings_fingerprint(processor)}"
+
+    def detection_key(self, image_hash, processor, reduction):
+        return f"{image_hash}-{detection_fingerprint(processor, reduction)}"
+
+    def get_result(self, key):
+        """Gibt das gespeicherte Ergebnis zurück (Speicher vor Festplatte) oder None"""
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                value = _from_disk(*entry)
+            if value is not None:
+                self.memory.put(key, value, _entry_size(value))
+        return value
+
+    def put_result(self, key, value):
+        self.memory.put(key, value, _entry_size(value))
+        if self.disk is not None:
+            entry = _to_disk(value)
+            if entry is not None:
+                self.disk.put(key, *entry)
+
+    def get_detection(self, key):
+        return self.detections.get(key)
+
+    def put_detection(self, key, value):
+        self.detections.put(key, value)
+
+    def stats(self):
+        """Treffer- und Fehlzähler aller Ebenen"""
+        return {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None,
+            'detection': self.detections.stats(),
+        }
+
+
+def _entry_size(value):
+    """Ungefährer Speicherbedarf eines Cache-Eintrags"""
+    buffer = getattr(value, 'buffer', None)
+    return len(buffer) if buffer is not None else 0
+
+
+def _to_disk(value):
+    """(Metadaten, Nutzdaten) eines Ergebnisses für den Festplatten-Cache (None, wenn nicht speicherbar)"""
+    # Erst hier importiert, da pipeline den Cache selbst importiert
+    from pipeline import CachedRejection, PipelineResult
+    if isinstance(value, PipelineResult):
+        meta = {'type': 'result', 'quality': int(value.quality), 'attempts': int(value.attempts),
+                'scale': float(value.scale)}
+        return meta, np.asarray(value.buffer, dtype=np.uint8).tobytes()
+    if isinstance(value, CachedRejection):
+        return {'type': 'rejection', 'message': value.message, 'status': int(value.status),
+                'reason': value.reason}, b''
+    return None
+
+
+def _from_disk(meta, payload):
+    """Gegenstück zu _to_disk; veraltete oder unbekannte Einträge gelten als Fehlzugriff (None)"""
+    from pipeline import CachedRejection, PipelineResult
+    try:
+        if meta['type'] == 'result':
+            buffer = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 1)
+            return PipelineResult(buffer, int(meta['quality']), int(meta['attempts']), float(meta['scale']))
+        if meta['type'] == 'rejection':
+            return CachedRejection(str(meta['message']), int(meta['status']), str(meta['reason']))
+    except (KeyError, TypeError, ValueError) as e:
+        logger.warning("Veralteter Cache-Eintrag verworfen: %s", e)
+    return None
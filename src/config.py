@@ -1,3 +1,4 @@
+import copy
 import json
 from pathlib import Path
 import sys
@@ -7,6 +8,17 @@ DEFAULT_CONFIG = {
     "face_detection": {
         "scale_factor": 1.3,  # Skalierungsfaktor für Gesichtserkennung
         "min_neighbors": 5,   # Mindestanzahl Nachbarn für Gesicht
+        "detection_max_size": 1000, # Max. Kantenlänge des Erkennungsbildes in Pixel (0 = volle Auflösung)
+        "upsample": 1,              # Anzahl Hochskalierungen für den HOG-Detektor
+        "backend": "hog",           # Detektor: hog (Dlib), haar (OpenCV), dnn (OpenCV DNN) oder cascade
+        "cascade": ["haar", "hog"], # Kaskade: schneller Detektor schlägt vor, zweiter prüft nur diese Bereiche
+        "cascade_padding": 0.3,     # Rand um die Kandidaten für die Prüfung (Anteil der Boxgröße)
+        "cascade_fallback": True,   # Zweiten Detektor auf dem ganzen Bild ausführen, wenn der erste nichts findet
+        "haar_model": "haarcascade_frontalface_default.xml",  # Haar-Cascade (src/models/ oder OpenCV-Daten)
+        "haar_min_size": 40,        # Minimale Gesichtsgröße für Haar in Pixel
+        "dnn_model": "res10_300x300_ssd_iter_140000.caffemodel",  # Gewichte des DNN-Detektors
+        "dnn_config": "deploy.prototxt",  # Netzbeschreibung des DNN-Detektors (leer, wenn nicht nötig)
+        "dnn_confidence": 0.6,      # Minimale Konfidenz des DNN-Detektors
         "head_height_factor": 1.4,  # Faktor für Kopfhöhe
         "total_height_factor": 1.8, # Faktor für Gesamthöhe
         "width_ratio": 0.75         # Breitenverhältnis des Bildes
@@ -27,11 +39,76 @@ DEFAULT_CONFIG = {
         "move_step": 10,                # Verschiebeschritt in Pixel
         "name_extension": ""  # Präfix für Dateinamen
     },
+    "quality_gate": {
+        "enabled": True,            # Schnelle Vorprüfung vor der Gesichtserkennung
+        "max_size": 320,            # Kantenlänge der verkleinerten Kopie in Pixel
+        "min_sharpness": 15.0,      # Minimale Laplace-Varianz im schärfsten Bildbereich (0 = aus)
+        "max_dark_fraction": 0.4,   # Maximaler Anteil fast schwarzer Pixel im Bild (0 = aus)
+        "max_bright_fraction": 0,   # Maximaler Anteil fast weißer Pixel im Bild (0 = aus, trifft auch weiße Hintergründe)
+        "max_background_std": 0     # Maximale Streuung des Hintergrunds neben dem Kopf (0 = aus)
+    },
     "image_quality": {
         "min_jpeg_quality": 30,     # Minimale JPEG-Qualität
         "start_jpeg_quality": 95,   # Startwert für JPEG-Qualität
         "quality_step": 5           # Schrittweite für Qualitätsreduktion
     },
+    "decode": {
+        "max_upload_mb": 25,        # Maximale Uploadgröße in MB
+        "max_batch_mb": 100,        # Maximale Gesamtgröße einer Anfrage an /process/batch in MB
+        "max_megapixels": 50,       # Maximale Bildgröße in Megapixel
+        "min_face_fraction": 0.25   # Mindestanteil der Gesichtshöhe an der kürzeren Bildkante (0 = immer volle Auflösung)
+    },
+    "cache": {
+        "enabled": True,            # Ergebnis-Cache für wiederholte Uploads
+        "memory_entries": 256,      # Maximale Anzahl Ergebnisse im Speicher
+        "memory_mb": 64,            # Maximale Größe des Speicher-Caches in MB
+        "disk_dir": "",             # Verzeichnis für den Festplatten-Cache (leer = deaktiviert)
+        "disk_mb": 512,             # Maximale Größe des Festplatten-Caches in MB
+        "detection_entries": 1024   # Maximale Anzahl gespeicherter Erkennungsergebnisse
+    },
+    "jobs": {
+        "workers": 2,               # Anzahl Worker-Threads für asynchrone Aufträge
+        "max_queue": 32,            # Maximale Anzahl wartender Aufträge (danach 429)
+        "result_ttl": 600           # Aufbewahrungszeit fertiger Ergebnisse in Sekunden
+    },
+    "metrics": {
+        "enabled": True,            # Zeitmessung der Verarbeitungsstufen und /metrics
+        "server_timing": False      # Stufenzeiten als Server-Timing-Header an jede Antwort anhängen
+    },
+    "sessions": {
+        "max_sessions": 16,         # Maximale Anzahl gleichzeitiger Anpassungssitzungen
+        "memory_mb": 512,           # Maximaler Speicher für Bilder und Vorschau-Pyramiden in MB
+        "ttl": 300,                 # Sitzung nach so vielen Sekunden ohne Zugriff verwerfen
+        "preview_quality": 80       # JPEG-Qualität der Vorschau während der Anpassung
+    },
+    "video": {
+        "frame_step": 1,            # Nur jedes N-te Bild eines Videos auswerten
+        "max_frames": 0,            # Höchstens so viele Bilder auswerten (0 = alle)
+        "min_tracking_psr": 7.0     # Unterhalb dieser Tracking-Güte wird das Gesicht neu erkannt
+    },
+    "group": {
+        "detection_max_size": 3000, # Max. Kantenlänge des Erkennungsbildes für Gruppenfotos (kleine Gesichter)
+        "max_faces": 100            # Höchstens so viele Gesichter pro Gruppenfoto verarbeiten
+    },
+    "profiles": {
+        # Ausgabeprofile: Zielgröße, Dateigröße und optionale Abweichungen von
+        # 'biometric_checks' und 'image_quality' für andere Dokumentformate
+        "web": {
+            "target_size": [413, 531],  # 35x45 mm bei 300 dpi
+            "max_file_size_kb": 500
+        },
+        "print": {
+            "target_size": [827, 1063],  # 35x45 mm bei 600 dpi
+            "max_file_size_kb": 2048,
+            "image_quality": {"min_jpeg_quality": 70}
+        },
+        "us_visa": {
+            "target_size": [600, 600],  # 2x2 Zoll bei 300 dpi
+            "max_file_size_kb": 240,
+            "biometric_checks": {"min_face_hight": 50.0, "max_face_height": 69.0, "chin_hight": 18.0,
+                                 "min_eye_hight": 56.0, "max_eye_hight": 69.0}
+        }
+    },
     "ui": {
         "qt_style": "Fusion"  # Standard-Style
     }
@@ -66,11 +143,46 @@ class Config:
             json.dump(self.settings, f, indent=4, ensure_ascii=False)
     
     def get(self, section, key):
-        """Gibt einen Konfigurationswert zurück"""
-        return self.settings[section][key]
+        """Gibt einen Konfigurationswert zurück (mit Standardwert, falls in der Datei nicht vorhanden)"""
+        try:
+            return self.settings[section][key]
+        except KeyError:
+            return DEFAULT_CONFIG[section][key]
     
     def set(self, section, key, value):
         """Setzt einen Konfigurationswert"""
         if section not in self.settings:
             self.settings[section] = {}
-        self.settings[section][key] = value
\ No newline at end of file
+        self.settings[section][key] = value
+
+    def profile_names(self):
+        """Namen aller Ausgabeprofile (Standardprofile und Profile aus der Datei)"""
+        return list(dict(DEFAULT_CONFIG['profiles'], **self.settings.get('profiles', {})))
+
+    def profile(self, name):
+        """Gibt die Konfiguration eines Ausgabeprofils zurück (KeyError, wenn unbekannt)"""
+        profiles = dict(DEFAULT_CONFIG['profiles'], **self.settings.get('profiles', {}))
+        return ProfileConfig(self, name, profiles[name])
+
+
+class ProfileConfig:
+    """Konfiguration mit den Abweichungen eines Ausgabeprofils, nur lesend.
+
+    Verhält sich für get() wie Config; Abschnitte des Profils überschreiben
+    einzelne Werte der Basiskonfiguration.
+    """
+    def __init__(self, base, name, profile):
+        self.name = name
+        self.target_size = tuple(profile['target_size'])
+        self.max_file_size = int(profile['max_file_size_kb'] * 1024)
+        self.settings = copy.deepcopy(base.settings)
+        for section, values in profile.items():
+            if isinstance(values, dict):
+                self.settings.setdefault(section, {}).update(values)
+
+    def get(self, section, key):
+        """Gibt einen Konfigurationswert zurück (mit Standardwert, falls nicht gesetzt)"""
+        try:
+            return self.settings[section][key]
+        except KeyError:
+            return DEFAULT_CONFIG[section][key]
\ No newline at end of file
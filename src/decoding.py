@@ -0,0 +1,107 @@
+import struct
+import cv2
+
+# Verkleinerungsstufen, die libjpeg direkt beim Dekodieren unterstützt
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# JPEG-Marker mit Bildgröße (Start of Frame)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(data):
+    """Liest (Breite, Höhe) aus dem JPEG-, PNG-, BMP- oder WebP-Header, ohne das Bild zu dekodieren.
+
+    Gibt None zurück, wenn das Format nicht erkannt wird (z.B. TIFF); solche
+    Bilder prüft decode_image erst nach dem Dekodieren.
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+    if data[:2] == b'BM' and len(data) >= 26:
+        return _bmp_size(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _webp_size(data)
+
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Füllbytes überspringen
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS and pos + 9 <= len(data):
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        if marker == 0xDA:
+            # Bilddaten beginnen, ohne dass ein SOF gefunden wurde
+            return None
+        pos += 2 + length
+    return None
+
+
+def _bmp_size(data):
+    # BITMAPCOREHEADER (12 Bytes) mit 16-Bit-Größen, sonst 32 Bit; negative Höhe = von oben nach unten
+    if struct.unpack('<I', data[14:18])[0] == 12:
+        return struct.unpack('<HH', data[18:22])
+    width, height = struct.unpack('<ii', data[18:26])
+    return abs(width), abs(height)
+
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        # Verlustbehaftet: 14-Bit-Größen nach dem Startcode des Schlüsselbildes
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        # Verlustfrei: Breite-1 und Höhe-1 als 14-Bit-Felder nach der Signatur 0x2F
+        bits = struct.unpack('<I', data[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        # Erweitert: Leinwand Breite-1 und Höhe-1 als 24-Bit-Werte
+        return (int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1)
+    return None
+
+
+def choose_reduction(size, target_face_height, min_face_fraction):
+    """Wählt die größte Verkleinerung, bei der das Gesicht noch mindestens target_face_height Pixel hoch ist.
+
+    Angenommen wird, dass das Gesicht mindestens min_face_fraction der kürzeren
+    Bildkante einnimmt (die EXIF-Orientierung ändert die kürzere Kante nicht).
+    """
+    if size is None or min_face_fraction <= 0:
+        return 1
+    face_height = min(size) * min_face_fraction
+    for reduction in sorted(REDUCED_FLAGS, reverse=True):
+        if face_height / reduction >= target_face_height:
+            return reduction
+    return 1
+
+
+def estimate_peak_memory(upload_bytes, width, height, detection_max_size, target_size):
+    """Schätzt den Spitzenspeicher einer Anfrage in Bytes.
+
+    Upload + BGR-Bild + Graustufenbild + Erkennungsbild + Ausgabefenster
+    (inklusive JPEG-Puffer in gleicher Größenordnung).
+    """
+    pixels = width * height
+    if detection_max_size and max(width, height) > detection_max_size:
+        factor = detection_max_size / max(width, height)
+        proxy_pixels = int(pixels * factor * factor)
+    else:
+        proxy_pixels = 0
+    output_pixels = target_size[0] * target_size[1]
+    return upload_bytes + pixels * 3 + pixels + proxy_pixels + output_pixels * 3 * 2
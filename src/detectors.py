@@ -0,0 +1,255 @@
+"""Austauschbare Gesichtsdetektoren.
+
+Jeder Detektor wird wie der Dlib-HOG-Detektor aufgerufen: detector(gray, upsample)
+liefert dlib.rectangles, das größte bzw. sicherste Gesicht zuerst. Welcher
+Detektor verwendet wird, steht in face_detection.backend der Konfiguration.
+"""
+import json
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import dlib
+import numpy as np
+
+from model_registry import find_model_path
+
+BACKENDS = ('hog', 'haar', 'dnn', 'cascade')
+
+
+def _rectangles(boxes):
+    """(links, oben, rechts, unten)-Boxen als dlib.rectangles"""
+    rects = dlib.rectangles()
+    for left, top, right, bottom in boxes:
+        rects.append(dlib.rectangle(int(left), int(top), int(right), int(bottom)))
+    return rects
+
+
+def _iou(a, b):
+    """Überlappung (Intersection over Union) zweier (links, oben, rechts, unten)-Boxen"""
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    return intersection / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection)
+
+
+def _suppress_overlaps(boxes, max_iou=0.5):
+    """Entfernt mehrfach gefundene Gesichter; behält von überlappenden Boxen die größte, größte zuerst"""
+    kept = []
+    for box in sorted(boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]), reverse=True):
+        if all(_iou(box, other) <= max_iou for other in kept):
+            kept.append(box)
+    return kept
+
+
+def _find_model(filename, fallback_dir=None):
+    """Sucht eine Modelldatei wie das Landmark-Modell, sonst im mitgelieferten OpenCV-Verzeichnis"""
+    if Path(filename).is_absolute():
+        return Path(filename)
+    try:
+        return find_model_path(filename)
+    except FileNotFoundError:
+        if fallback_dir is not None and (Path(fallback_dir) / filename).exists():
+            return Path(fallback_dir) / filename
+        raise
+
+
+class _InstancePool:
+    """Wiederverwendbare Instanzen eines nicht threadsicheren OpenCV-Objekts.
+
+    Jeder Aufruf leiht sich eine freie Instanz; neu geladen wird nur, wenn alle
+    in Benutzung sind. Höchstens max_idle Instanzen werden aufbewahrt, sodass
+    ein Server mit einem Thread pro Anfrage die Modelle nicht jedes Mal neu liest.
+    """
+
+    def __init__(self, factory, max_idle=4):
+        self.factory = factory
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        # Einmal laden, damit ein fehlendes oder defektes Modell sofort auffällt
+        self._idle.put(factory())
+
+    @contextmanager
+    def borrow(self):
+        try:
+            instance = self._idle.get_nowait()
+        except queue.Empty:
+            instance = self.factory()
+        try:
+            yield instance
+        finally:
+            try:
+                self._idle.put_nowait(instance)
+            except queue.Full:
+                pass
+
+
+class HogDetector:
+    """Dlib-HOG-Detektor (Standard), aus der prozessweiten Modell-Registry"""
+
+    name = 'hog'
+
+    def __init__(self, models):
+        self.models = models
+
+    def __call__(self, gray, upsample=1):
+        return self.models.detector(gray, upsample)
+
+
+class HaarDetector:
+    """OpenCV-Haar-Cascade; sehr schnell, aber nur für frontale Gesichter.
+
+    detectMultiScale ist nicht als threadsicher dokumentiert, daher nutzt jeder
+    gleichzeitige Aufruf einen eigenen Klassifikator aus einem kleinen Pool.
+    """
+
+    name = 'haar'
+
+    def __init__(self, model_path, scale_factor=1.3, min_neighbors=5, min_size=40):
+        self.model_path = str(model_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self._pool = _InstancePool(self._load)
+
+    def _load(self):
+        classifier = cv2.CascadeClassifier(self.model_path)
+        if classifier.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade {self.model_path}")
+        return classifier
+
+    def __call__(self, gray, upsample=1):
+        with self._pool.borrow() as classifier:
+            boxes = classifier.detectMultiScale(
+                gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+                minSize=(self.min_size, self.min_size))
+        # Größtes Gesicht zuerst
+        boxes = sorted((tuple(int(v) for v in box) for box in boxes), key=lambda b: b[2] * b[3], reverse=True)
+        return _rectangles((x, y, x + w, y + h) for x, y, w, h in boxes)
+
+
+class DnnDetector:
+    """OpenCV-DNN-Detektor (SSD, z.B. res10_300x300) aus lokalen Modelldateien.
+
+    Net.forward ist nicht threadsicher, daher nutzt jeder gleichzeitige Aufruf
+    ein eigenes Netz aus einem kleinen Pool.
+    """
+
+    name = 'dnn'
+
+    def __init__(self, model_path, config_path=None, confidence=0.6, input_size=300,
+                 mean=(104.0, 177.0, 123.0)):
+        self.model_path = str(model_path)
+        self.config_path = str(config_path) if config_path else ''
+        self.confidence = confidence
+        self.input_size = input_size
+        self.mean = mean
+        self._pool = _InstancePool(lambda: cv2.dnn.readNet(self.model_path, self.config_path))
+
+    def __call__(self, gray, upsample=1):
+        h, w = gray.shape[:2]
+        image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR) if gray.ndim == 2 else gray
+        blob = cv2.dnn.blobFromImage(image, 1.0, (self.input_size, self.input_size), self.mean)
+        with self._pool.borrow() as net:
+            net.setInput(blob)
+            detections = net.forward().reshape(-1, 7)
+        # Spalten: Bild, Klasse, Konfidenz, x1, y1, x2, y2 (relativ zur Bildgröße)
+        detections = detections[detections[:, 2] >= self.confidence]
+        detections = detections[detections[:, 2].argsort()[::-1]]
+        boxes = []
+        for _, _, _, x1, y1, x2, y2 in detections:
+            left, top = max(0, int(x1 * w)), max(0, int(y1 * h))
+            right, bottom = min(w, int(x2 * w)), min(h, int(y2 * h))
+            if right > left and bottom > top:
+                boxes.append((left, top, right, bottom))
+        return _rectangles(boxes)
+
+
+class CascadeDetector:
+    """Ein schneller Detektor schlägt Kandidaten vor, ein genauerer prüft nur diese Bereiche.
+
+    Mit fallback läuft der genauere Detektor auf dem ganzen Bild, wenn der
+    schnelle nichts findet (z.B. bei gedrehten Köpfen, die Haar verpasst).
+    Überlappende Kandidaten und Nachbargesichter im Randbereich liefern dasselbe
+    Gesicht mehrfach; Boxen mit IoU über max_iou werden daher zusammengefasst.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, proposer, verifier, padding=0.3, fallback=True, max_iou=0.5):
+        self.proposer = proposer
+        self.verifier = verifier
+        self.padding = padding
+        self.fallback = fallback
+        self.max_iou = max_iou
+
+    def __call__(self, gray, upsample=1):
+        h, w = gray.shape[:2]
+        candidates = self.proposer(gray, upsample)
+        if len(candidates) == 0:
+            return self.verifier(gray, upsample) if self.fallback else dlib.rectangles()
+
+        boxes = []
+        for candidate in candidates:
+            pad_x = int(candidate.width() * self.padding)
+            pad_y = int(candidate.height() * self.padding)
+            left, top = max(0, candidate.left() - pad_x), max(0, candidate.top() - pad_y)
+            right, bottom = min(w, candidate.right() + pad_x), min(h, candidate.bottom() + pad_y)
+            # Nur der Kandidatenbereich wird kopiert (Dlib braucht zusammenhängenden Speicher)
+            region = np.ascontiguousarray(gray[top:bottom, left:right])
+            for face in self.verifier(region, upsample):
+                boxes.append((face.left() + left, face.top() + top, face.right() + left, face.bottom() + top))
+        return _rectangles(_suppress_overlaps(boxes, self.max_iou))
+
+
+def create_detector(name, config, models):
+    """Erzeugt den Detektor name ('hog', 'haar', 'dnn' oder 'cascade') aus der Konfiguration"""
+    if name == 'hog':
+        return HogDetector(models)
+    if name == 'haar':
+        # opencv-python bringt die Haar-Cascades in cv2.data.haarcascades mit
+        opencv_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', None)
+        return HaarDetector(
+            _find_model(config.get('face_detection', 'haar_model'), opencv_dir),
+            scale_factor=config.get('face_detection', 'scale_factor'),
+            min_neighbors=int(config.get('face_detection', 'min_neighbors')),
+            min_size=int(config.get('face_detection', 'haar_min_size')))
+    if name == 'dnn':
+        dnn_config = config.get('face_detection', 'dnn_config')
+        return DnnDetector(
+            _find_model(config.get('face_detection', 'dnn_model')),
+            _find_model(dnn_config) if dnn_config else None,
+            confidence=config.get('face_detection', 'dnn_confidence'))
+    if name == 'cascade':
+        proposer, verifier = config.get('face_detection', 'cascade')
+        if 'cascade' in (proposer, verifier):
+            raise ValueError("Eine Kaskade kann keine Kaskade enthalten")
+        return CascadeDetector(get_detector(config, models, proposer), get_detector(config, models, verifier),
+                               padding=config.get('face_detection', 'cascade_padding'),
+                               fallback=bool(config.get('face_detection', 'cascade_fallback')))
+    raise ValueError(f"Unbekannter Detektor: {name} (möglich: {', '.join(BACKENDS)})")
+
+
+# Bereits erzeugte Detektoren je Einstellungen, damit Modelle nur einmal pro Prozess geladen werden
+_detectors = {}
+# RLock, da eine Kaskade ihre Stufen ebenfalls über get_detector erzeugt
+_lock = threading.RLock()
+
+
+def get_detector(config, models, name=None):
+    """Gibt den konfigurierten Detektor zurück (einmal pro Prozess und Einstellungen erzeugt)"""
+    name = name or config.get('face_detection', 'backend')
+    if name == 'hog':
+        # Der HOG-Detektor kommt direkt aus der Registry, ohne zusätzlichen Aufrufrahmen
+        return models.detector
+    key = (name, id(models), json.dumps(config.settings.get('face_detection'), sort_keys=True, default=str))
+    detector = _detectors.get(key)
+    if detector is None:
+        with _lock:
+            detector = _detectors.get(key)
+            if detector is None:
+                detector = _detectors[key] = create_detector(name, config, models)
+    return detector
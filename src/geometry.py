@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+# Füllfarbe für Bereiche außerhalb des Quellbildes (weißer Rand wie beim Zuschnitt)
+BORDER_WHITE = (255, 255, 255)
+
+
+def rotation_matrix(image_shape, angle):
+    """Rotationsmatrix (2x3) um die Bildmitte, wie cv2.getRotationMatrix2D"""
+    h, w = image_shape[:2]
+    center = (w // 2, h // 2)
+    return cv2.getRotationMatrix2D(center, angle, 1.0)
+
+
+def identity_matrix():
+    """Affine Einheitsmatrix (2x3)"""
+    return np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+
+def crop_transform(scale, crop_left, crop_top, rotation=None):
+    """Baut eine Affine aus Rotation, Skalierung und Zuschnitt-Offset.
+
+    Entspricht ``warpAffine(rotation)`` gefolgt von ``resize(scale)`` und dem
+    Ausschneiden ab (crop_left, crop_top) im skalierten Bild. Die Halbpixel-
+    Korrektur bildet die Pixelmitten-Konvention von cv2.resize nach.
+    """
+    matrix = identity_matrix() if rotation is None else np.asarray(rotation, dtype=np.float64)
+    matrix = matrix * scale
+    half_pixel = 0.5 * (scale - 1.0)
+    matrix[0, 2] += half_pixel - crop_left
+    matrix[1, 2] += half_pixel - crop_top
+    return matrix
+
+
+def clamp_window(start, scaled_size, window_size):
+    """Hält das Ausschnittfenster innerhalb des skalierten Bildes.
+
+    Ist das Bild kleiner als das Fenster, wird es mittig platziert.
+    """
+    if scaled_size >= window_size:
+        return min(max(start, 0), scaled_size - window_size)
+    return -((window_size - scaled_size) // 2)
+
+
+def warp_window(image, matrix, size, interpolation=cv2.INTER_LANCZOS4, border_value=BORDER_WHITE):
+    """Rendert nur das Ausgabefenster der Größe (Breite, Höhe) in einem Schritt"""
+    return cv2.warpAffine(image, matrix, tuple(size), flags=interpolation,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+
+
+def transform_points(points, matrix):
+    """Wendet eine 2x3-Affine auf (N, 2)-Punkte an"""
+    points = np.asarray(points, dtype=np.float64)
+    return points @ matrix[:, :2].T + matrix[:, 2]
+
+
+def level_transform(matrix, factor):
+    """Überträgt eine Affine vom Originalbild auf eine Pyramidenstufe mit Verkleinerungsfaktor factor.
+
+    cv2.pyrDown halbiert die Koordinaten ohne Pixelmitten-Verschiebung
+    (x_original = x_stufe / factor), daher wird nur der lineare Anteil skaliert.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    level = matrix.copy()
+    level[:, :2] = matrix[:, :2] / factor
+    return level
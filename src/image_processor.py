@@ -1,16 +1,21 @@
 import cv2
 import numpy as np
-from pathlib import Path
 import dlib
-import os
-import sys
+from model_registry import get_registry
+from detectors import get_detector
+from metrics import get_metrics
+from jpeg_encoder import encode_to_size
+from landmarks import (as_landmarks, check_faces, CHECK_SIDE_RATIO, CHECK_HEAD_TILT,
+                       CHECK_MOUTH, CHECK_EYES)
+from geometry import rotation_matrix, crop_transform, clamp_window, warp_window
+from quality import downsample, quality_metrics, check_quality, quality_message
 
 class BiometricImageProcessor:
     """Verarbeitet Bilder zu biometrischen Passbildern"""
 
     def __init__(self, target_size=(413, 531), max_file_size=500*1024, name_extension="",
                  debug_mode=True, auto_rotate=False, scal_check=True, eye_check=True, mouth_check=False, side_ratio_check=True, head_tilt_check=True,
-                 config=None):
+                 config=None, models=None):
         # Zielgröße des Passbildes (Breite, Höhe)
         self.target_size = target_size
         # Maximale Dateigröße in Bytes
@@ -45,194 +50,214 @@ class BiometricImageProcessor:
         self.rotate_angle = self.config.get('biometric_checks', 'rotate_angle')  # Rotationswinkel in Grad
         self.move_step = int(self.config.get('biometric_checks', 'move_step'))  # Pixel pro Tastendruck
 
-        # Path to the dlib landmark model, made robust for running from different locations
-        # and for PyInstaller. The model is expected to be in the same directory as this script.
-        if getattr(sys, 'frozen', False):
-            # we are running in a bundle
-            base_path = sys._MEIPASS
-        else:
-            # we are running in a normal Python environment
-            base_path = Path(__file__).parent
-
-        model_path = Path(base_path) / "shape_predictor_68_face_landmarks.dat"
-
-        if not model_path.exists():
-            # If not found, try the src subdir, for when running from root
-            model_path = Path(base_path) / "src" / "shape_predictor_68_face_landmarks.dat"
-            if not model_path.exists():
-                 raise FileNotFoundError(f"Could not find shape_predictor_68_face_landmarks.dat")
-
-        # Dlib-Modelle für Gesichtserkennung und präzise Landmark-Erkennung
-        self.predictor = dlib.shape_predictor(str(model_path))
-        self.detector = dlib.get_frontal_face_detector()
+        # Dlib-Modelle für Gesichtserkennung und präzise Landmark-Erkennung.
+        # Die Modelle werden nur einmal pro Prozess geladen und gemeinsam genutzt.
+        self.models = models if models is not None else get_registry()
+        self.predictor = self.models.predictor
+        # Gesichtsdetektor laut face_detection.backend (Standard: Dlib-HOG)
+        self.detector = get_detector(self.config, self.models)
     
+    @property
+    def target_face_height(self):
+        """Ziel-Gesichtshöhe in Pixel (Mitte zwischen minimaler und maximaler Gesichtshöhe)"""
+        target_h = self.target_size[1]
+        min_face_height = self.min_face_hight_factor * target_h
+        max_face_height = self.max_face_hight_factor * target_h
+        return (min_face_height + max_face_height) / 2
+
+    def detection_proxy(self, gray, max_size=None):
+        """Verkleinerte Kopie für Vorprüfung und Erkennung (gray selbst, wenn es klein genug ist).
+
+        max_size überschreibt die Kantenlänge des Erkennungsbildes aus der Konfiguration.
+        """
+        if max_size is None:
+            max_size = self.config.get('face_detection', 'detection_max_size')
+        max_size = int(max_size)
+        h, w = gray.shape[:2]
+        if max_size <= 0 or max(h, w) <= max_size:
+            return gray
+        factor = max_size / max(h, w)
+        proxy_w, proxy_h = max(1, int(round(w * factor))), max(1, int(round(h * factor)))
+        return cv2.resize(gray, (proxy_w, proxy_h), interpolation=cv2.INTER_AREA)
+
+    def detect_faces(self, gray, max_size=None, proxy=None):
+        """Erkennt Gesichter auf einer verkleinerten Kopie und rechnet die Boxen auf volle Auflösung zurück.
+
+        max_size überschreibt die Kantenlänge des Erkennungsbildes aus der Konfiguration;
+        ein bereits berechnetes detection_proxy kann als proxy übergeben werden.
+        """
+        with get_metrics().stage('detect'):
+            return self._detect_faces(gray, max_size, proxy)
+
+    def _detect_faces(self, gray, max_size=None, proxy=None):
+        # Eigentliche Erkennung, siehe detect_faces
+        upsample = int(self.config.get('face_detection', 'upsample'))
+        if proxy is None:
+            proxy = self.detection_proxy(gray, max_size)
+
+        if proxy is not gray:
+            # Erkennung auf Proxy-Bild mit begrenzter Kantenlänge
+            h, w = gray.shape[:2]
+            proxy_h, proxy_w = proxy.shape[:2]
+            faces = self.detector(proxy, upsample)
+            if len(faces) > 0:
+                # Boxen zurück in Koordinaten des Originalbildes skalieren
+                fx, fy = w / proxy_w, h / proxy_h
+                scaled = dlib.rectangles()
+                for f in faces:
+                    scaled.append(dlib.rectangle(int(round(f.left() * fx)), int(round(f.top() * fy)),
+                                                 int(round(f.right() * fx)), int(round(f.bottom() * fy))))
+                return scaled
+
+        # Rückfall auf volle Auflösung (kleines Bild oder kein Gesicht im Proxy gefunden)
+        return self.detector(gray, upsample)
 
     def process_image(self, image, shape, scale_override=None, offset_x=0, offset_y=0, rotation_angle=0):
         """Schneidet das Bild nach biometrischen Vorgaben zu, mit optionalem Offset und Rotation"""
-        target_w, target_h = self.target_size  # Zielbreite und -höhe
+        matrix, _ = self.crop_geometry(image.shape, shape, scale_override, offset_x, offset_y, rotation_angle)
+        return self.render_crop(image, matrix)
 
-        # Bild rotieren, falls rotation_angle != 0
-        if rotation_angle != 0:
-            center = (image.shape[1] // 2, image.shape[0] // 2)
-            rot_mat = cv2.getRotationMatrix2D(center, rotation_angle, 1.0)
-            image = cv2.warpAffine(image, rot_mat, (image.shape[1], image.shape[0]))
-            
+    def crop_geometry(self, image_shape, shape, scale_override=None, offset_x=0, offset_y=0, rotation_angle=0):
+        """Berechnet die Affine für den Zuschnitt und den angewendeten Skalierungsfaktor"""
+        target_w, target_h = self.target_size  # Zielbreite und -höhe
 
         # Landmark-Koordinaten auslesen
-        chin = np.array([shape.part(8).x, shape.part(8).y])  # Kinn
-        brow = np.array([shape.part(27).x, shape.part(27).y])  # Augenbrauenmitte
-        left_eye = np.mean([[shape.part(i).x, shape.part(i).y] for i in range(36, 42)], axis=0)
-        right_eye = np.mean([[shape.part(i).x, shape.part(i).y] for i in range(42, 48)], axis=0)
-        eyes_center = (left_eye + right_eye) / 2  # Mittelpunkt zwischen den Augen
+        landmarks = as_landmarks(shape)
+        chin = landmarks.chin.astype(np.float64)  # Kinn
+        eyes_center = landmarks.eyes_center.astype(np.float64)  # Mittelpunkt zwischen den Augen
 
         # Gesichtshöhe berechnen
         face_height = np.linalg.norm(chin - eyes_center) * self.chin_to_eye_factor
 
-        # Ziel-Gesichtshöhe berechnen
-        min_face_height = self.min_face_hight_factor * target_h
-        max_face_height = self.max_face_hight_factor * target_h
-        target_face_height = (min_face_height + max_face_height) / 2
-
         # Skalierungsfaktor bestimmen
-        scale = target_face_height / face_height
+        scale = self.target_face_height / face_height
 
         # Optional: manuelle Skalierung anwenden
         if scale_override is not None:
-            scale = (target_face_height / face_height) * scale_override
-
-        # Bild skalieren
-        scaled_img = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LANCZOS4)
+            scale = (self.target_face_height / face_height) * scale_override
 
         # Landmarks nach Skalierung anpassen
-        def scale_point(pt): return np.array(pt) * scale
-        chin_s = scale_point(chin)
-        brow_s = scale_point(brow)
-        eyes_center_s = scale_point(eyes_center)
+        chin_s = chin * scale
+        eyes_center_s = eyes_center * scale
 
         # Zielposition für das Kinn bestimmen
         chin_target_y = target_h * (1 - self.chin_hight_factor)
 
         # Zuschneidebereich berechnen (mit Offset)
         crop_top = int(round(chin_s[1] - chin_target_y)) + offset_y
-        crop_bottom = crop_top + target_h
         crop_center_x = int(round(eyes_center_s[0])) + offset_x
         crop_left = crop_center_x - target_w // 2
-        crop_right = crop_left + target_w
-
-        # Zuschneidebereich an Bildränder anpassen
-        h_s, w_s = scaled_img.shape[:2]
-        if crop_top < 0:
-            crop_top = 0
-            crop_bottom = target_h
-        if crop_bottom > h_s:
-            crop_bottom = h_s
-            crop_top = h_s - target_h
-        if crop_left < 0:
-            crop_left = 0
-            crop_right = target_w
-        if crop_right > w_s:
-            crop_right = w_s
-            crop_left = w_s - target_w
-
-        # Bild zuschneiden
-        cropped = scaled_img[crop_top:crop_bottom, crop_left:crop_right]
-
-        # Falls das Bild zu klein ist, mit weiß auffüllen
-        if cropped.shape[0] != target_h or cropped.shape[1] != target_w:
-            result = np.ones((target_h, target_w, 3), dtype=np.uint8) * 255
-            y_offset = max(0, (target_h - cropped.shape[0]) // 2)
-            x_offset = max(0, (target_w - cropped.shape[1]) // 2)
-            result[y_offset:y_offset+cropped.shape[0], x_offset:x_offset+cropped.shape[1]] = cropped
-            cropped = result
-
-        return cropped
+
+        # Zuschneidebereich an Bildränder anpassen (Größe wie bei cv2.resize)
+        h_s = int(round(image_shape[0] * scale))
+        w_s = int(round(image_shape[1] * scale))
+        crop_top = clamp_window(crop_top, h_s, target_h)
+        crop_left = clamp_window(crop_left, w_s, target_w)
+
+        # Rotation, Skalierung und Zuschnitt in einer Affine zusammenfassen
+        rotation = rotation_matrix(image_shape, rotation_angle) if rotation_angle != 0 else None
+        return crop_transform(scale, crop_left, crop_top, rotation), scale
+
+    def render_crop(self, image, matrix):
+        """Rendert nur das Ausgabefenster; Bereiche außerhalb des Bildes werden weiß gefüllt"""
+        with get_metrics().stage('crop'):
+            return warp_window(image, matrix, self.target_size)
+
+    def encode_jpeg(self, image, max_size):
+        """Kodiert das Bild mit der höchsten JPEG-Qualität, die die Zieldateigröße einhält.
+
+        Gibt ein EncodeResult (Puffer, Qualität, Anzahl Kodierungen) zurück und
+        wirft JpegSizeError, wenn die Größe auch mit minimaler Qualität nicht erreichbar ist.
+        """
+        metrics = get_metrics()
+        with metrics.stage('jpeg'):
+            result = encode_to_size(
+                image, max_size,
+                min_quality=self.config.get('image_quality', 'min_jpeg_quality'),
+                max_quality=self.config.get('image_quality', 'start_jpeg_quality'),
+                step=self.config.get('image_quality', 'quality_step'))
+        metrics.observe('passbild_jpeg_encode_attempts', result.attempts)
+        return result
 
     def adjust_jpeg_quality(self, image, max_size):
         """Passt die JPEG-Qualität an, um die Zieldateigröße zu erreichen"""
-        quality = int(self.config.get('image_quality', 'start_jpeg_quality'))
-        min_quality = int(self.config.get('image_quality', 'min_jpeg_quality'))
-        quality_step = int(self.config.get('image_quality', 'quality_step'))
-        
-        while quality > min_quality:
-            # Bild als JPEG kodieren
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-            _, encoded_img = cv2.imencode('.jpg', image, encode_param)
-            
-            if encoded_img.nbytes <= max_size:
-                return encoded_img
-            
-            quality -= quality_step
-            
-        return encoded_img
+        return self.encode_jpeg(image, max_size).buffer
     
     def check_biometric_requirements(self, shape):
         """Prüft, ob das Gesicht biometrischen Anforderungen entspricht"""
         try:
-            # Prüfung auf frontale Ausrichtung
-            if self.side_ratio_check:
-                left_eye_nose_dist = np.linalg.norm(
-                    np.array([shape.part(36).x, shape.part(36).y]) - 
-                    np.array([shape.part(31).x, shape.part(31).y])
-                )
-                right_eye_nose_dist = np.linalg.norm(
-                    np.array([shape.part(45).x, shape.part(45).y]) - 
-                    np.array([shape.part(35).x, shape.part(35).y])
-                )
-                side_ratio = left_eye_nose_dist / right_eye_nose_dist
-                tolerance = self.config.get('biometric_checks', 'side_ratio_tolerance')
-                if side_ratio < (1 - tolerance) or side_ratio > (1 + tolerance):
-                    return False, f"Kopf nicht frontal ausgerichtet (Verhältnis: {side_ratio:.2f})"
-
-            # Prüfung auf Kopfneigung
-            if self.head_tilt_check:
-                left_eye = np.mean([(shape.part(36+i).x, shape.part(36+i).y) for i in range(6)], axis=0)
-                right_eye = np.mean([(shape.part(42+i).x, shape.part(42+i).y) for i in range(6)], axis=0)
-                angle = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
-                max_tilt = self.config.get('biometric_checks', 'max_head_tilt')
-                if abs(angle) > max_tilt:
-                    return False, f"Kopfneigung zu stark: {angle:.1f}°"
-
-            # Prüfung auf Mundöffnung
-            if self.mouth_check:
-                mouth_top = shape.part(62).y
-                mouth_bottom = shape.part(66).y
-                mouth_gap = mouth_bottom - mouth_top
-                max_gap = self.config.get('biometric_checks', 'max_mouth_gap')
-                if mouth_gap > max_gap:
-                    return False, "Mund muss geschlossen sein"
-
-            # Prüfung auf Augenöffnung
-            if self.eye_check:
-                left_eye_ratio = self._eye_aspect_ratio([shape.part(i) for i in range(36,42)])
-                right_eye_ratio = self._eye_aspect_ratio([shape.part(i) for i in range(42,48)])
-                min_eye_ratio = self.config.get('biometric_checks', 'min_eye_ratio')
-                if left_eye_ratio < min_eye_ratio or right_eye_ratio < min_eye_ratio:
-                    return False, "Augen müssen geöffnet sein"
-
-            return True, "OK"
+            with get_metrics().stage('checks'):
+                codes, metrics = check_faces(as_landmarks(shape).points, **self._check_thresholds())
+            return self.check_message(int(codes), metrics)
         except Exception as e:
             if self.debug_mode:
                 print(f"Debug: Fehler in check_biometric_requirements: {str(e)}")
             return False, f"Fehler bei Gesichtserkennung: {str(e)}"
 
-    def _eye_aspect_ratio(self, eye_points):
-        """Berechnet das Verhältnis der Augenöffnung"""
-        points = [(p.x, p.y) for p in eye_points]
-        points = np.array(points)
-        A = np.linalg.norm(points[1] - points[5])
-        B = np.linalg.norm(points[2] - points[4])
-        C = np.linalg.norm(points[0] - points[3])
-        return (A + B) / (2.0 * C)
+    def check_image_quality(self, gray):
+        """Prüft Schärfe, Belichtung und Hintergrund auf einer kleinen Kopie, bevor der Detektor läuft.
+
+        gray ist üblicherweise das detection_proxy, damit das Bild in voller
+        Auflösung nur einmal verkleinert wird. Gibt (gültig, Meldung) wie
+        check_biometric_requirements zurück.
+        """
+        if not self.config.get('quality_gate', 'enabled'):
+            return True, "OK"
+        with get_metrics().stage('precheck'):
+            metrics = quality_metrics(downsample(gray, int(self.config.get('quality_gate', 'max_size'))))
+
+        def threshold(key):
+            # 0 deaktiviert die jeweilige Prüfung
+            return self.config.get('quality_gate', key) or None
+
+        code = check_quality(metrics,
+                             min_sharpness=threshold('min_sharpness'),
+                             max_dark_fraction=threshold('max_dark_fraction'),
+                             max_bright_fraction=threshold('max_bright_fraction'),
+                             max_background_std=threshold('max_background_std'))
+        return quality_message(code, metrics)
+
+    def check_biometric_requirements_batch(self, points):
+        """Prüft (N, 68, 2)-Landmarks mehrerer Gesichter auf einmal.
+
+        Gibt Prüfcodes (landmarks.CHECK_*) und die Kennzahlen je Gesicht zurück;
+        check_message(codes[i], metrics, i) liefert die Meldung zu einem Gesicht.
+        """
+        return check_faces(points, **self._check_thresholds())
+
+    def check_message(self, code, metrics, index=None):
+        """Übersetzt einen Prüfcode in (gültig, Meldung) wie check_biometric_requirements"""
+        def value(key):
+            return float(metrics[key] if index is None else metrics[key][index])
+
+        if code == CHECK_SIDE_RATIO:
+            return False, f"Kopf nicht frontal ausgerichtet (Verhältnis: {value('side_ratio'):.2f})"
+        if code == CHECK_HEAD_TILT:
+            return False, f"Kopfneigung zu stark: {value('head_tilt'):.1f}°"
+        if code == CHECK_MOUTH:
+            return False, "Mund muss geschlossen sein"
+        if code == CHECK_EYES:
+            return False, "Augen müssen geöffnet sein"
+        return True, "OK"
+
+    def _check_thresholds(self):
+        """Schwellwerte der aktivierten Prüfungen (None = Prüfung deaktiviert)"""
+        def threshold(enabled, key):
+            return self.config.get('biometric_checks', key) if enabled else None
+
+        return {
+            'side_ratio_tolerance': threshold(self.side_ratio_check, 'side_ratio_tolerance'),
+            'max_head_tilt': threshold(self.head_tilt_check, 'max_head_tilt'),
+            'max_mouth_gap': threshold(self.mouth_check, 'max_mouth_gap'),
+            'min_eye_ratio': threshold(self.eye_check, 'min_eye_ratio'),
+        }
 
     def auto_rotate_image(self, image, shape):
         """Dreht das Bild so, dass die Augen waagrecht stehen"""
-        left_eye = np.mean([(shape.part(36+i).x, shape.part(36+i).y) for i in range(6)], axis=0)
-        right_eye = np.mean([(shape.part(42+i).x, shape.part(42+i).y) for i in range(6)], axis=0)
-        angle = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
-        center = (image.shape[1] // 2, image.shape[0] // 2)
-        rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-        rotated = cv2.warpAffine(image, rotation_matrix, (image.shape[1], image.shape[0]))
-        return rotated
+        landmarks = as_landmarks(shape)
+        eye_delta = landmarks.right_eye_center - landmarks.left_eye_center
+        angle = float(np.degrees(np.arctan2(eye_delta[1], eye_delta[0])))
+        return warp_window(image, rotation_matrix(image.shape, angle), (image.shape[1], image.shape[0]))
 
     def draw_debug_visualization(self, image, shape, dlib_rect):
         """Zeichnet Hilfslinien und Markierungen ins Bild"""
@@ -262,9 +287,8 @@ class BiometricImageProcessor:
         cv2.rectangle(debug_img, (x, y), (x+w, y+h), (0, 0, 255), 2)
 
         # Dlib-Landmarks (gelb)
-        for i in range(68):
-            point = (shape.part(i).x, shape.part(i).y)
-            cv2.circle(debug_img, point, 2, (0, 255, 255), -1)
+        for x_p, y_p in as_landmarks(shape).points.astype(int):
+            cv2.circle(debug_img, (int(x_p), int(y_p)), 2, (0, 255, 255), -1)
 
         # Zuschnittbereich (grün)
         cv2.rectangle(debug_img, 
@@ -0,0 +1,177 @@
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Zustände eines Auftrags
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Die Warteschlange ist voll; der Auftrag soll nach retry_after Sekunden erneut gesendet werden"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Warteschlange voll, erneut versuchen in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Ein asynchroner Verarbeitungsauftrag mit Warte- und Bearbeitungszeit"""
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def wait_seconds(self):
+        """Zeit in der Warteschlange"""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.submitted_at
+
+    @property
+    def service_seconds(self):
+        """Bearbeitungszeit im Worker"""
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'wait_seconds': round(self.wait_seconds, 4),
+            'service_seconds': None if self.service_seconds is None else round(self.service_seconds, 4),
+        }
+
+
+class JobManager:
+    """Feste Anzahl Worker-Threads mit begrenzter Warteschlange (ohne externen Broker).
+
+    handler(payload) erledigt die eigentliche Arbeit; on_start wird einmal pro
+    Worker vor dem ersten Auftrag aufgerufen (z.B. zum Laden der Modelle).
+    """
+
+    def __init__(self, handler, workers=2, max_queue=32, result_ttl=600, on_start=None):
+        self.handler = handler
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.on_start = on_start
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._running = 0
+        # Zuletzt gemessene Zeiten für Statistik und Retry-After-Schätzung
+        self._wait_times = deque(maxlen=200)
+        self._service_times = deque(maxlen=200)
+        self._rejected = 0
+        self._threads = []
+        # Wartende Worker räumen in diesem Abstand abgelaufene Ergebnisse ab, auch ohne neue Anfragen
+        self._sweep_interval = min(max(result_ttl, 0.1), 60)
+
+    def start(self):
+        """Startet die Worker-Threads (einmalig)"""
+        with self._lock:
+            if self._threads:
+                return self
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, payload):
+        """Stellt einen Auftrag ein oder wirft QueueFullError (Gegendruck)"""
+        self.start()
+        job = Job(payload)
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self._rejected += 1
+            raise QueueFullError(self.retry_after())
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            # Abgelaufene Ergebnisse nicht mehr ausliefern, auch wenn seit ihrem Ablauf nichts eingereicht wurde
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def retry_after(self):
+        """Geschätzte Sekunden, bis wieder Platz in der Warteschlange ist"""
+        with self._lock:
+            service = sum(self._service_times) / len(self._service_times) if self._service_times else 1.0
+        return max(1, math.ceil(service * self._queue.qsize() / max(1, self.workers)))
+
+    def stats(self):
+        """Warteschlangenlänge sowie mittlere Warte- und Bearbeitungszeiten"""
+        with self._lock:
+            waits, services = list(self._wait_times), list(self._service_times)
+            running, rejected = self._running, self._rejected
+        return {
+            'workers': self.workers,
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'running': running,
+            'rejected': rejected,
+            'avg_wait_seconds': sum(waits) / len(waits) if waits else None,
+            'avg_service_seconds': sum(services) / len(services) if services else None,
+        }
+
+    def _expire(self):
+        # Abgeschlossene Aufträge nach Ablauf der Aufbewahrungszeit entfernen (Aufruf mit Lock)
+        now = time.monotonic()
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            if job.finished_at is not None and now - job.finished_at > self.result_ttl:
+                del self._jobs[job_id]
+
+    def _work(self):
+        if self.on_start is not None:
+            try:
+                self.on_start()
+            except Exception:
+                # Der Fehler wird beim ersten Auftrag im Ergebnis gemeldet
+                pass
+        while True:
+            try:
+                job = self._queue.get(timeout=self._sweep_interval)
+            except queue.Empty:
+                with self._lock:
+                    self._expire()
+                continue
+            job.started_at = time.monotonic()
+            job.status = RUNNING
+            with self._lock:
+                self._running += 1
+            try:
+                job.result = self.handler(job.payload)
+                job.status = DONE
+            except Exception as e:
+                job.error = e
+                job.status = FAILED
+            finally:
+                job.finished_at = time.monotonic()
+                # Upload-Daten werden nicht mehr benötigt
+                job.payload = None
+                with self._lock:
+                    self._running -= 1
+                    self._wait_times.append(job.wait_seconds)
+                    self._service_times.append(job.service_seconds)
+                self._queue.task_done()
@@ -0,0 +1,100 @@
+import threading
+from collections import deque, namedtuple
+import cv2
+import numpy as np
+
+# Ergebnis der Größensuche: JPEG-Puffer, verwendete Qualität und Anzahl Kodierungen
+EncodeResult = namedtuple('EncodeResult', ['buffer', 'quality', 'attempts'])
+
+
+class JpegSizeError(ValueError):
+    """Die Zieldateigröße ist auch mit minimaler JPEG-Qualität nicht erreichbar"""
+
+    def __init__(self, max_size, min_quality, smallest_size):
+        self.max_size = max_size
+        self.min_quality = min_quality
+        self.smallest_size = smallest_size
+        super().__init__(
+            f"Dateigröße {max_size} Bytes nicht erreichbar: bei minimaler Qualität "
+            f"{min_quality} sind es {smallest_size} Bytes")
+
+
+class QualityPredictor:
+    """Merkt sich zuletzt passende Qualitätswerte je Zielgröße und Bildformat"""
+
+    def __init__(self, history=32):
+        self.history = history
+        self._lock = threading.Lock()
+        self._qualities = {}
+
+    def predict(self, key, default):
+        """Schätzt die passende Qualität aus den letzten Ergebnissen (Median)"""
+        with self._lock:
+            recent = self._qualities.get(key)
+            if not recent:
+                return default
+            return int(np.median(recent))
+
+    def record(self, key, quality):
+        """Speichert eine erfolgreich verwendete Qualität"""
+        with self._lock:
+            self._qualities.setdefault(key, deque(maxlen=self.history)).append(quality)
+
+
+# Prozessweite Historie, damit Anfragen voneinander lernen
+_predictor = QualityPredictor()
+
+
+def encode_to_size(image, max_size, min_quality, max_quality, step=1, predictor=_predictor):
+    """Sucht per Binärsuche die höchste JPEG-Qualität, deren Datei max_size nicht überschreitet.
+
+    Geprüft werden dieselben Stufen wie bei der schrittweisen Reduktion
+    (max_quality, max_quality - step, ..., min_quality). Die Suche beginnt bei der
+    aus früheren Ergebnissen vorhergesagten Stufe. Wirft JpegSizeError, wenn selbst
+    ``min_quality`` zu groß ist.
+    """
+    min_quality, max_quality, step = int(min_quality), int(max_quality), max(1, int(step))
+    # Qualitätsstufen absteigend, die minimale Qualität immer als letzte Stufe
+    levels = list(range(max_quality, min_quality, -step)) + [min_quality]
+    key = (int(max_size), image.shape)
+    buffers = {}
+
+    def fits(index):
+        quality = levels[index]
+        _, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        buffers[index] = encoded
+        return encoded.nbytes <= max_size
+
+    # Gesucht ist der kleinste passende Index in (low, high]; high == len(levels) heißt "keiner bekannt"
+    low, high = -1, len(levels)
+    predicted = predictor.predict(key, max_quality)
+    start = min(range(len(levels)), key=lambda i: abs(levels[i] - predicted))
+    if fits(start):
+        high = start
+        # Nachbarstufe mit höherer Qualität prüfen, meist ist die Suche damit beendet
+        if start > 0:
+            if fits(start - 1):
+                high = start - 1
+            else:
+                low = start - 1
+    else:
+        low = start
+        # Nachbarstufe mit niedrigerer Qualität prüfen
+        if start + 1 < len(levels):
+            if fits(start + 1):
+                high = start + 1
+            else:
+                low = start + 1
+
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            high = middle
+        else:
+            low = middle
+
+    if high == len(levels):
+        raise JpegSizeError(max_size, min_quality, buffers[len(levels) - 1].nbytes)
+
+    predictor.record(key, levels[high])
+    return EncodeResult(buffers[high], levels[high], len(buffers))
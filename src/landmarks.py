@@ -0,0 +1,116 @@
+import numpy as np
+
+# Benannte Bereiche der 68 Dlib-Landmarks
+JAW = slice(0, 17)
+NOSE = slice(27, 36)
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+MOUTH = slice(48, 68)
+
+# Einzelne Punkte
+CHIN = 8
+BROW_CENTER = 27
+NOSE_LEFT = 31
+NOSE_RIGHT = 35
+LEFT_EYE_OUTER = 36
+RIGHT_EYE_OUTER = 45
+MOUTH_TOP = 62
+MOUTH_BOTTOM = 66
+
+# Prüfcodes der Stapelprüfung (in Prüfreihenfolge)
+CHECK_OK = 0
+CHECK_SIDE_RATIO = 1
+CHECK_HEAD_TILT = 2
+CHECK_MOUTH = 3
+CHECK_EYES = 4
+
+
+class Landmarks:
+    """Die 68 Landmarks eines Gesichts als (68, 2)-float32-Array mit benannten Bereichen.
+
+    Wird einmal aus dem dlib.full_object_detection erzeugt und von allen
+    Prüfungen und Geometrieberechnungen gemeinsam genutzt.
+    """
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float32).reshape(68, 2)
+        self.jaw = self.points[JAW]
+        self.nose = self.points[NOSE]
+        self.left_eye = self.points[LEFT_EYE]
+        self.right_eye = self.points[RIGHT_EYE]
+        self.mouth = self.points[MOUTH]
+        self.chin = self.points[CHIN]
+        self.brow_center = self.points[BROW_CENTER]
+        # Augenmittelpunkte werden nur einmal berechnet
+        self.left_eye_center = self.left_eye.mean(axis=0)
+        self.right_eye_center = self.right_eye.mean(axis=0)
+        self.eyes_center = (self.left_eye_center + self.right_eye_center) / 2
+
+    @classmethod
+    def from_shape(cls, shape):
+        """Erzeugt die Landmarks aus einem dlib.full_object_detection"""
+        return cls([(p.x, p.y) for p in shape.parts()])
+
+    def __len__(self):
+        return len(self.points)
+
+
+def as_landmarks(shape):
+    """Akzeptiert Landmarks, (68, 2)-Arrays oder dlib.full_object_detection"""
+    if isinstance(shape, Landmarks):
+        return shape
+    if isinstance(shape, np.ndarray):
+        return Landmarks(shape)
+    return Landmarks.from_shape(shape)
+
+
+def eye_aspect_ratio(eyes):
+    """Augenöffnung für (..., 6, 2)-Augenpunkte"""
+    a = np.linalg.norm(eyes[..., 1, :] - eyes[..., 5, :], axis=-1)
+    b = np.linalg.norm(eyes[..., 2, :] - eyes[..., 4, :], axis=-1)
+    c = np.linalg.norm(eyes[..., 0, :] - eyes[..., 3, :], axis=-1)
+    return (a + b) / (2.0 * c)
+
+
+def face_metrics(points):
+    """Berechnet alle biometrischen Kennzahlen für (68, 2)- oder (N, 68, 2)-Landmarks.
+
+    Gibt ein Dict mit Arrays der Form () bzw. (N,) zurück.
+    """
+    points = np.asarray(points, dtype=np.float32)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        left_eye_nose = np.linalg.norm(points[..., LEFT_EYE_OUTER, :] - points[..., NOSE_LEFT, :], axis=-1)
+        right_eye_nose = np.linalg.norm(points[..., RIGHT_EYE_OUTER, :] - points[..., NOSE_RIGHT, :], axis=-1)
+        eye_delta = points[..., RIGHT_EYE, :].mean(axis=-2) - points[..., LEFT_EYE, :].mean(axis=-2)
+        return {
+            'side_ratio': left_eye_nose / right_eye_nose,
+            'head_tilt': np.degrees(np.arctan2(eye_delta[..., 1], eye_delta[..., 0])),
+            'mouth_gap': points[..., MOUTH_BOTTOM, 1] - points[..., MOUTH_TOP, 1],
+            'left_eye_ratio': eye_aspect_ratio(points[..., LEFT_EYE, :]),
+            'right_eye_ratio': eye_aspect_ratio(points[..., RIGHT_EYE, :]),
+        }
+
+
+def check_faces(points, side_ratio_tolerance=None, max_head_tilt=None, max_mouth_gap=None, min_eye_ratio=None):
+    """Prüft (N, 68, 2)-Landmarks auf einmal und gibt (Prüfcodes je Gesicht, Kennzahlen) zurück.
+
+    Eine Prüfung mit Schwellwert None ist deaktiviert. Gemeldet wird jeweils die
+    erste fehlgeschlagene Prüfung in der Reihenfolge Seitenverhältnis,
+    Kopfneigung, Mund, Augen (wie check_biometric_requirements).
+    """
+    metrics = face_metrics(points)
+    codes = np.full(np.shape(metrics['side_ratio']), CHECK_OK, dtype=np.int8)
+    failures = []
+    if side_ratio_tolerance is not None:
+        ratio = metrics['side_ratio']
+        failures.append((CHECK_SIDE_RATIO, (ratio < 1 - side_ratio_tolerance) | (ratio > 1 + side_ratio_tolerance)))
+    if max_head_tilt is not None:
+        failures.append((CHECK_HEAD_TILT, np.abs(metrics['head_tilt']) > max_head_tilt))
+    if max_mouth_gap is not None:
+        failures.append((CHECK_MOUTH, metrics['mouth_gap'] > max_mouth_gap))
+    if min_eye_ratio is not None:
+        failures.append((CHECK_EYES, (metrics['left_eye_ratio'] < min_eye_ratio) | (metrics['right_eye_ratio'] < min_eye_ratio)))
+    # Rückwärts eintragen, damit die erste fehlgeschlagene Prüfung gewinnt
+    for code, failed in reversed(failures):
+        codes = np.where(failed, code, codes)
+    return codes, metrics
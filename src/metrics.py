@@ -0,0 +1,206 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# Bucket-Grenzen der Histogramme
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MEGAPIXEL_BUCKETS = (0.5, 1, 2, 4, 8, 12, 16, 24, 40, 60)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+# Beschreibung und Buckets der bekannten Histogramme
+HISTOGRAMS = {
+    'passbild_stage_seconds': ('Dauer der Verarbeitungsstufen in Sekunden', SECONDS_BUCKETS),
+    'passbild_request_seconds': ('Dauer der HTTP-Anfragen in Sekunden', SECONDS_BUCKETS),
+    'passbild_input_megapixels': ('Größe der Eingabebilder in Megapixel', MEGAPIXEL_BUCKETS),
+    'passbild_jpeg_encode_attempts': ('Anzahl JPEG-Kodierungen pro Bild', ATTEMPT_BUCKETS),
+}
+COUNTERS = {
+    'passbild_rejections_total': 'Abgelehnte Bilder nach Grund',
+    'passbild_detector_seconds_saved_estimated_total':
+        'Schätzung (keine Messung) der durch die Vorprüfung eingesparten Erkennungszeit in Sekunden',
+    'passbild_redecodes_total': 'Erneute Dekodierungen, weil das Gesicht für die Verkleinerung zu klein war',
+}
+
+# Zeiten der Stufen der aktuellen Anfrage (für Server-Timing)
+_request_timings = contextvars.ContextVar('passbild_request_timings', default=None)
+_NULL_CONTEXT = nullcontext()
+
+
+def reason_label(message):
+    """Kurzer Ablehnungsgrund ohne Messwerte, damit die Anzahl der Label-Werte begrenzt bleibt"""
+    return re.split(r'[:(]', message, maxsplit=1)[0].strip()
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Zeitmessung der Verarbeitungsstufen mit Ausgabe im Prometheus-Textformat.
+
+    Ist die Messung deaktiviert, liefert stage() einen leeren Kontextmanager.
+    Über set_profiler() kann ein eigener Profiler jede Stufe umschließen.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._profiler = None
+
+    def set_profiler(self, factory):
+        """Setzt einen Profiler: factory(stage) muss einen Kontextmanager zurückgeben (None = aus)"""
+        self._profiler = factory
+
+    def add_collector(self, collector):
+        """Registriert eine Funktion, die zusätzliche Zeilen im Prometheus-Format liefert"""
+        self._collectors.append(collector)
+
+    def stage(self, name):
+        """Kontextmanager, der die Dauer einer Verarbeitungsstufe misst"""
+        if not self.enabled and self._profiler is None:
+            return _NULL_CONTEXT
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        profiler = self._profiler(name) if self._profiler is not None else _NULL_CONTEXT
+        start = time.perf_counter()
+        try:
+            with profiler:
+                yield
+        finally:
+            if self.enabled:
+                duration = time.perf_counter() - start
+                self.observe('passbild_stage_seconds', duration, stage=name)
+                timings = _request_timings.get()
+                if timings is not None:
+                    timings.append((name, duration))
+
+    def observe(self, name, value, **labels):
+        """Trägt einen Messwert in ein Histogramm ein"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def mean(self, name, **labels):
+        """Mittelwert eines Histogramms (None ohne Messwerte)"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None or histogram.count == 0:
+                return None
+            return histogram.sum / histogram.count
+
+    def inc(self, name, amount=1, **labels):
+        """Erhöht einen Zähler"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def start_request(self):
+        """Beginnt die Sammlung der Stufenzeiten für die aktuelle Anfrage"""
+        if not self.enabled:
+            return None
+        return _request_timings.set([])
+
+    def current_timings(self):
+        """Bisher gemessene Stufenzeiten der aktuellen Anfrage"""
+        return list(_request_timings.get() or [])
+
+    def finish_request(self, token):
+        """Beendet die Sammlung und gibt die Stufenzeiten als Liste (Name, Sekunden) zurück"""
+        if token is None:
+            return []
+        timings = _request_timings.get() or []
+        _request_timings.reset(token)
+        return timings
+
+    def render(self):
+        """Alle Messwerte im Prometheus-Textformat"""
+        with self._lock:
+            histograms = {key: (h.buckets, list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name, (description, _) in HISTOGRAMS.items():
+            series = sorted((key, value) for key, value in histograms.items() if key[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for (_, labels), (buckets, counts, total, count) in series:
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, description in COUNTERS.items():
+            series = sorted((key, value) for key, value in counters.items() if key[0] == name)
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for (_, labels), value in series:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def family_lines(name, kind, description, samples):
+    """Eine Metrik-Familie als zusammenhängender Block: HELP, TYPE und danach alle Werte.
+
+    samples enthält Paare (Labels als Dict, Wert); das Textformat verlangt, dass
+    die Werte einer Familie direkt auf ihre eigene TYPE-Zeile folgen.
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labels.items())} {value}")
+    return lines
+
+
+def server_timing_header(timings):
+    """Formatiert Stufenzeiten als Server-Timing-Header"""
+    return ", ".join(f"{name};dur={duration * 1000:.1f}" for name, duration in timings)
+
+
+# Prozessweite Instanz, wird von allen Stufen gemeinsam genutzt
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Gibt die prozessweite Metrik-Instanz zurück"""
+    return _metrics
@@ -0,0 +1,109 @@
+import threading
+import time
+from pathlib import Path
+import dlib
+import sys
+
+MODEL_FILENAME = "shape_predictor_68_face_landmarks.dat"
+
+
+def find_model_path(filename=MODEL_FILENAME):
+    """Sucht eine Modelldatei, standardmäßig das Dlib-Landmark-Modell (auch für PyInstaller und Start aus dem Projektverzeichnis)"""
+    if getattr(sys, 'frozen', False):
+        # we are running in a bundle
+        base_path = sys._MEIPASS
+    else:
+        # we are running in a normal Python environment
+        base_path = Path(__file__).parent
+
+    model_path = Path(base_path) / filename
+
+    if not model_path.exists():
+        # If not found, try the src subdir, for when running from root, and the models subdir
+        for candidate in (Path(base_path) / "src" / filename, Path(base_path) / "models" / filename,
+                          Path(base_path) / "src" / "models" / filename):
+            if candidate.exists():
+                return candidate
+        raise FileNotFoundError(f"Could not find {filename}")
+    return model_path
+
+
+class ModelRegistry:
+    """Lädt die Dlib-Modelle einmal pro Prozess und stellt sie allen Anfragen zur Verfügung.
+
+    Predictor und Detector werden nach dem Laden nur noch lesend verwendet und
+    können daher von mehreren Threads gleichzeitig genutzt werden.
+    """
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+        self._lock = threading.Lock()
+        self._predictor = None
+        self._detector = None
+        # Letzter Ladefehler (für die Bereitschaftsprüfung)
+        self.load_error = None
+        # Ladedauer in Sekunden
+        self.load_seconds = None
+
+    @property
+    def is_ready(self):
+        """True, sobald alle Modelle geladen sind"""
+        return self._predictor is not None and self._detector is not None
+
+    def load(self):
+        """Lädt die Modelle, falls noch nicht geschehen (threadsicher)"""
+        if self.is_ready:
+            return self
+        with self._lock:
+            if self.is_ready:
+                return self
+            start = time.perf_counter()
+            try:
+                model_path = self.model_path or find_model_path()
+                predictor = dlib.shape_predictor(str(model_path))
+                detector = dlib.get_frontal_face_detector()
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self._predictor = predictor
+            self._detector = detector
+            self.load_error = None
+            self.load_seconds = time.perf_counter() - start
+        return self
+
+    def preload(self):
+        """Lädt die Modelle im Hintergrund, damit der Prozess schnell startet"""
+        def _load():
+            try:
+                self.load()
+            except Exception:
+                # Fehler ist in load_error festgehalten und wird über status() gemeldet
+                pass
+        thread = threading.Thread(target=_load, name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def predictor(self):
+        return self.load()._predictor
+
+    @property
+    def detector(self):
+        return self.load()._detector
+
+    def status(self):
+        """Gibt den Ladezustand für die Bereitschaftsprüfung zurück"""
+        return {
+            'ready': self.is_ready,
+            'load_seconds': self.load_seconds,
+            'error': self.load_error,
+        }
+
+
+# Prozessweite Instanz, wird von allen Prozessoren gemeinsam genutzt
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """Gibt die prozessweite Modell-Registry zurück"""
+    return _registry
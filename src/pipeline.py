@@ -0,0 +1,344 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import logging
+import os
+import cv2
+import numpy as np
+from landmarks import CHECK_OK, Landmarks
+from cache import hash_bytes
+from metrics import get_metrics, reason_label
+from jpeg_encoder import JpegSizeError
+from decoding import REDUCED_FLAGS, read_image_size, choose_reduction, estimate_peak_memory
+
+logger = logging.getLogger(__name__)
+
+# Verarbeitungsoptionen der Weboberfläche, auch Standard für die Ordnerverarbeitung
+PROCESSOR_OPTIONS = {
+    'target_size': (413, 531),
+    'max_file_size': 500 * 1024,
+    'debug_mode': False,
+    'auto_rotate': True,
+    'scal_check': False,
+    'eye_check': True,
+    'mouth_check': False,
+    'side_ratio_check': True,
+    'head_tilt_check': True,
+}
+
+
+# Zuschnitt und Kodierung mehrerer Ausgabeprofile laufen parallel (OpenCV gibt den GIL frei)
+_render_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='render')
+
+
+# Ergebnis der Verarbeitung: JPEG-Puffer, JPEG-Qualität, Anzahl Kodierungen und angewendete Skalierung
+PipelineResult = namedtuple('PipelineResult', ['buffer', 'quality', 'attempts', 'scale'])
+
+
+# Dekodiertes Bild und der beim Dekodieren angewendete Verkleinerungsfaktor
+DecodedImage = namedtuple('DecodedImage', ['image', 'reduction'])
+
+
+# Ergebnis eines Gesichts im Gruppenfoto: Nummer, Box (links, oben, rechts, unten), Prüfergebnis,
+# PipelineResult (None bei Ablehnung) und Fehler
+GroupFace = namedtuple('GroupFace', ['index', 'box', 'valid', 'message', 'result', 'error'])
+
+
+# Im Cache gespeicherte Ablehnung eines Bildes
+CachedRejection = namedtuple('CachedRejection', ['message', 'status', 'reason'])
+
+
+class PipelineError(Exception):
+    """Ein Bild wurde abgelehnt oder konnte nicht verarbeitet werden"""
+
+    def __init__(self, message, status=400, reason=None):
+        super().__init__(message)
+        # HTTP-Statuscode für die Weboberfläche
+        self.status = status
+        # Ablehnungsgrund ohne Präfix (z.B. Meldung aus check_biometric_requirements)
+        self.reason = reason or message
+
+
+def record_rejection(error):
+    """Zählt eine Ablehnung in passbild_rejections_total (einmal, dort wo sie entsteht)"""
+    if isinstance(error, PipelineError):
+        get_metrics().inc('passbild_rejections_total', reason=reason_label(error.reason))
+    elif isinstance(error, JpegSizeError):
+        get_metrics().inc('passbild_rejections_total', reason='JPEG size')
+
+
+def decode_image(data, processor, reduce=True, reduction=None):
+    """Dekodiert hochgeladene Bilddaten speicherschonend zu einem BGR-Bild.
+
+    Größe und Pixelzahl werden vor dem Dekodieren geprüft (die Pixelzahl nur
+    bei JPEG, PNG, BMP und WebP; andere Formate wie TIFF erst danach). Reicht eine kleinere
+    Auflösung für die Ziel-Gesichtshöhe, dekodiert libjpeg direkt verkleinert
+    (IMREAD_REDUCED_*); reduce=False dekodiert immer in voller Auflösung (z.B.
+    für Gruppenfotos mit kleinen Gesichtern), reduction erzwingt eine Stufe aus
+    REDUCED_FLAGS. Die EXIF-Orientierung wendet OpenCV beim Dekodieren an.
+    """
+    config = processor.config
+    max_bytes = int(config.get('decode', 'max_upload_mb') * 1024 * 1024)
+    max_pixels = config.get('decode', 'max_megapixels') * 1000000
+    if len(data) > max_bytes:
+        raise PipelineError(f'Upload too large ({len(data)} bytes, limit {max_bytes} bytes)', status=413)
+
+    size = read_image_size(data)
+    if size is not None and size[0] * size[1] > max_pixels:
+        raise PipelineError(f'Image too large ({size[0]}x{size[1]} pixels)', status=413)
+
+    if reduction is None:
+        reduction = choose_reduction(size, processor.target_face_height,
+                                     config.get('decode', 'min_face_fraction')) if reduce else 1
+    file_bytes = np.frombuffer(data, np.uint8)
+    with get_metrics().stage('decode'):
+        image = cv2.imdecode(file_bytes, REDUCED_FLAGS[reduction])
+    if image is None:
+        raise PipelineError('Could not decode image')
+    height, width = image.shape[:2]
+    get_metrics().observe('passbild_input_megapixels', width * height * reduction * reduction / 1000000)
+    if size is None and width * height > max_pixels:
+        raise PipelineError(f'Image too large ({width}x{height} pixels)', status=413)
+
+    peak = estimate_peak_memory(len(data), width, height,
+                                int(config.get('face_detection', 'detection_max_size')),
+                                processor.target_size)
+    logger.info("Dekodiert %dx%d (Verkleinerung 1/%d), geschätzter Spitzenspeicher %.1f MB",
+                width, height, reduction, peak / (1024 * 1024))
+    return DecodedImage(image, reduction)
+
+
+def detect_landmarks(processor, image):
+    """Erkennt das erste Gesicht und gibt seine Landmarks zurück (None, wenn kein Gesicht gefunden wird).
+
+    Vorher prüft check_image_quality das Erkennungsbild; unbrauchbare Bilder
+    werden mit PipelineError abgelehnt, ohne dass der Detektor läuft.
+    """
+    metrics = get_metrics()
+    with metrics.stage('grayscale'):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Die volle Auflösung wird nur einmal verkleinert, für Vorprüfung und Erkennung
+        proxy = processor.detection_proxy(gray)
+    is_valid, message = processor.check_image_quality(proxy)
+    if not is_valid:
+        # Keine Messung: eingesparte Zeit mit der bisher mittleren Erkennungsdauer geschätzt
+        metrics.inc('passbild_detector_seconds_saved_estimated_total',
+                    metrics.mean('passbild_stage_seconds', stage='detect') or 0.0)
+        raise PipelineError(f'Quality check failed: {message}', reason=message)
+    faces = processor.detect_faces(gray, proxy=proxy)
+
+    if len(faces) == 0:
+        return None
+
+    face = faces[0]
+    # Landmarks einmal in ein NumPy-Array überführen und für alle weiteren Schritte nutzen
+    with metrics.stage('landmarks'):
+        return Landmarks.from_shape(processor.predictor(gray, face))
+
+
+def refine_reduction(processor, data, decoded, landmarks):
+    """Dekodiert erneut mit geringerer Verkleinerung, wenn das erkannte Gesicht dafür zu klein ist.
+
+    choose_reduction nimmt vor der Erkennung eine Mindestgröße des Gesichts an.
+    Ist das gemessene Gesicht kleiner als die Ziel-Gesichtshöhe, würde der
+    Zuschnitt hochskalieren; dann wird mit der größten Verkleinerung dekodiert,
+    die die Ziel-Gesichtshöhe noch erreicht (notfalls in voller Auflösung).
+    Gibt (DecodedImage, Landmarks) zurück, die Landmarks umgerechnet auf das
+    neue Bild.
+    """
+    if decoded.reduction == 1:
+        return decoded, landmarks
+    face_height = float(np.linalg.norm(landmarks.chin - landmarks.eyes_center)) * processor.chin_to_eye_factor
+    target = processor.target_face_height
+    if face_height >= target:
+        return decoded, landmarks
+
+    full_height = face_height * decoded.reduction
+    reduction = max((r for r in REDUCED_FLAGS if r < decoded.reduction and full_height / r >= target), default=1)
+    logger.info("Gesicht nur %.0f Pixel hoch (Ziel %.0f), dekodiere erneut mit Verkleinerung 1/%d",
+                face_height, target, reduction)
+    get_metrics().inc('passbild_redecodes_total')
+    refined = decode_image(data, processor, reduction=reduction)
+    # Pixelmittelpunkte umrechnen; die Landmarks sind relativ zur Gesichtsgröße genau genug,
+    # eine zweite Erkennung ist nicht nötig
+    factor = decoded.reduction / reduction
+    return refined, Landmarks((landmarks.points + 0.5) * factor - 0.5)
+
+
+def locate_face(processor, data, decoded, cache=None, image_hash=None):
+    """Erkennt das Gesicht im dekodierten Upload, optional über den Erkennungs-Cache.
+
+    Gibt (DecodedImage, Landmarks) nach refine_reduction zurück und wirft
+    PipelineError, wenn kein Gesicht gefunden wird.
+    """
+    if cache is None:
+        landmarks = detect_landmarks(processor, decoded.image)
+    else:
+        landmarks = _cached_landmarks(cache, image_hash or hash_bytes(data), processor, decoded)
+    if not landmarks:
+        raise PipelineError('No face detected')
+    return refine_reduction(processor, data, decoded, landmarks)
+
+
+def run_pipeline(processor, image, reduction=1, landmarks=None):
+    """Erkennt das Gesicht, prüft die Biometrie, schneidet zu und kodiert als JPEG.
+
+    Gibt ein PipelineResult zurück (Skalierung bezogen auf das Originalbild vor
+    einer Verkleinerung beim Dekodieren) und wirft PipelineError bei Ablehnung.
+    Bereits bekannte Landmarks überspringen die Dlib-Stufe.
+    """
+    if landmarks is None:
+        landmarks = detect_landmarks(processor, image)
+    if landmarks is None:
+        raise PipelineError('No face detected')
+
+    is_valid, message = processor.check_biometric_requirements(landmarks)
+    if not is_valid:
+        raise PipelineError(f'Biometric check failed: {message}', reason=message)
+
+    matrix, scale = processor.crop_geometry(image.shape, landmarks)
+    processed_image = processor.render_crop(image, matrix)
+
+    encoded = processor.encode_jpeg(processed_image, processor.max_file_size)
+    return PipelineResult(encoded.buffer, encoded.quality, encoded.attempts, scale / reduction)
+
+
+def process_upload(processor, data, cache=None):
+    """Dekodiert und verarbeitet Upload-Daten, optional über den Ergebnis-Cache.
+
+    Mit Cache werden identische Uploads mit gleichen Einstellungen direkt
+    beantwortet (auch Ablehnungen); bei geänderten Ausgabeeinstellungen werden
+    zumindest Erkennung und Landmarks wiederverwendet. Ablehnungen werden hier
+    einmal pro Upload gezählt.
+    """
+    try:
+        return _process_upload(processor, data, cache)
+    except Exception as e:
+        record_rejection(e)
+        raise
+
+
+def _process_upload(processor, data, cache):
+    # Eigentliche Verarbeitung, siehe process_upload
+    if cache is None:
+        decoded, landmarks = locate_face(processor, data, decode_image(data, processor))
+        return run_pipeline(processor, decoded.image, decoded.reduction, landmarks)
+
+    image_hash = hash_bytes(data)
+    key = cache.result_key(image_hash, processor)
+    cached = cache.get_result(key)
+    if isinstance(cached, CachedRejection):
+        raise PipelineError(cached.message, status=cached.status, reason=cached.reason)
+    if cached is not None:
+        return cached
+
+    decoded = decode_image(data, processor)
+    try:
+        decoded, landmarks = locate_face(processor, data, decoded, cache, image_hash)
+        result = run_pipeline(processor, decoded.image, decoded.reduction, landmarks)
+    except PipelineError as e:
+        cache.put_result(key, CachedRejection(str(e), e.status, e.reason))
+        raise
+    cache.put_result(key, result)
+    return result
+
+
+def _cached_landmarks(cache, image_hash, processor, decoded):
+    """Landmarks aus dem Erkennungs-Cache oder neu erkannt (False, wenn kein Gesicht gefunden wurde)"""
+    detection_key = cache.detection_key(image_hash, processor, decoded.reduction)
+    landmarks = cache.get_detection(detection_key)
+    if landmarks is None:
+        # False merkt sich "kein Gesicht", None bedeutet "nicht im Cache"
+        landmarks = detect_landmarks(processor, decoded.image) or False
+        cache.put_detection(detection_key, landmarks)
+    return landmarks
+
+
+def process_profiles(processors, data, cache=None, executor=None):
+    """Rendert mehrere Ausgabeprofile aus einem Dekodier- und Erkennungsdurchlauf.
+
+    processors bildet Profilnamen auf Prozessoren ab. Dekodiert wird mit der
+    Auflösung, die das anspruchsvollste Profil braucht; Prüfung, Zuschnitt und
+    Kodierung laufen je Profil parallel. Gibt {Name: PipelineResult oder
+    Ausnahme} in der Reihenfolge von processors zurück; ohne Gesicht wird
+    PipelineError geworfen.
+    """
+    # Das Profil mit der größten Ziel-Gesichtshöhe bestimmt die Dekodier-Auflösung
+    primary = max(processors.values(), key=lambda p: p.target_face_height)
+    try:
+        decoded, landmarks = locate_face(primary, data, decode_image(data, primary), cache)
+    except Exception as e:
+        record_rejection(e)
+        raise
+
+    executor = executor or _render_executor
+    # Kontext je Aufgabe kopieren, damit die Stufenzeiten der Anfrage zugeordnet bleiben
+    futures = {name: executor.submit(contextvars.copy_context().run, run_pipeline,
+                                     processor, decoded.image, decoded.reduction, landmarks)
+               for name, processor in processors.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            record_rejection(e)
+            results[name] = e
+    return results
+
+
+def process_group(processor, data, executor=None):
+    """Verarbeitet alle Gesichter eines Gruppenfotos und gibt eine Liste von GroupFace zurück.
+
+    Dekodieren und Graustufenbild gibt es nur einmal; die Landmarks aller
+    Gesichter werden auf demselben Graustufenbild bestimmt und gemeinsam
+    geprüft. Zuschnitt und Kodierung laufen je Gesicht parallel und lesen direkt
+    aus dem gemeinsamen Bild. Wirft PipelineError, wenn kein Gesicht gefunden wird.
+    """
+    metrics = get_metrics()
+    try:
+        decoded = decode_image(data, processor, reduce=False)
+        image = decoded.image
+        with metrics.stage('grayscale'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = processor.detect_faces(gray, processor.config.get('group', 'detection_max_size'))
+        if len(faces) == 0:
+            raise PipelineError('No face detected')
+    except Exception as e:
+        record_rejection(e)
+        raise
+    faces = list(faces)[:int(processor.config.get('group', 'max_faces'))]
+
+    with metrics.stage('landmarks'):
+        landmarks = [Landmarks.from_shape(processor.predictor(gray, face)) for face in faces]
+    del gray
+    with metrics.stage('checks'):
+        codes, face_metrics = processor.check_biometric_requirements_batch(
+            np.stack([l.points for l in landmarks]))
+
+    def render(face_landmarks):
+        matrix, scale = processor.crop_geometry(image.shape, face_landmarks)
+        encoded = processor.encode_jpeg(processor.render_crop(image, matrix), processor.max_file_size)
+        return PipelineResult(encoded.buffer, encoded.quality, encoded.attempts, scale)
+
+    executor = executor or _render_executor
+    futures = {}
+    for index, face_landmarks in enumerate(landmarks):
+        if int(codes[index]) == CHECK_OK:
+            futures[index] = executor.submit(contextvars.copy_context().run, render, face_landmarks)
+
+    results = []
+    for index, face in enumerate(faces):
+        box = (face.left(), face.top(), face.right(), face.bottom())
+        valid, message = processor.check_message(int(codes[index]), face_metrics, index)
+        result = error = None
+        if index in futures:
+            try:
+                result = futures[index].result()
+            except Exception as e:
+                error = e
+                valid, message = False, str(e)
+                record_rejection(e)
+        elif not valid:
+            metrics.inc('passbild_rejections_total', reason=reason_label(message))
+        results.append(GroupFace(index, box, valid, message, result, error))
+    return results
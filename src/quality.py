@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+
+# Raster für die Schärfe: das schärfste Feld zählt, das Gesicht darf also an beliebiger Stelle im Bild sein
+SHARPNESS_GRID = 4
+# Hintergrundstreifen links und rechts neben dem Kopf (Anteil der Breite, Anteil der Höhe von oben);
+# setzt ein mittig aufgenommenes Gesicht voraus
+BACKGROUND_WIDTH = 0.15
+BACKGROUND_HEIGHT = 0.6
+
+# Grauwerte, ab denen ein Pixel als abgeschnitten (unter- bzw. überbelichtet) gilt
+DARK_LEVEL = 8
+BRIGHT_LEVEL = 247
+
+QUALITY_OK = 0
+QUALITY_BLUR = 1
+QUALITY_DARK = 2
+QUALITY_BRIGHT = 3
+QUALITY_BACKGROUND = 4
+
+
+def downsample(gray, max_size):
+    """Verkleinerte Kopie mit höchstens max_size Pixel Kantenlänge (INTER_AREA mittelt das Rauschen weg)"""
+    h, w = gray.shape[:2]
+    factor = max_size / max(h, w)
+    if factor >= 1:
+        return gray
+    return cv2.resize(gray, (max(1, int(round(w * factor))), max(1, int(round(h * factor)))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def quality_metrics(small):
+    """Schärfe, Belichtung und Hintergrund-Gleichmäßigkeit eines kleinen Graustufenbildes.
+
+    Vor der Erkennung ist die Lage des Gesichts unbekannt, daher gilt als
+    Schärfe die Laplace-Varianz des schärfsten Rasterfeldes (ein unscharfer
+    oder einfarbiger Hintergrund wird nicht bestraft) und die Belichtung wird
+    über das ganze Bild gemessen. Der Anteil fast weißer Pixel unterscheidet
+    ein überbelichtetes Gesicht nicht von einem weißen Hintergrund und ist
+    daher nur ein grobes Maß. Der Hintergrund wird nur in den Streifen links
+    und rechts neben dem Kopf bewertet.
+    """
+    h, w = small.shape[:2]
+    laplacian = cv2.Laplacian(small, cv2.CV_32F)
+    rows = np.linspace(0, h, SHARPNESS_GRID + 1).astype(int)
+    cols = np.linspace(0, w, SHARPNESS_GRID + 1).astype(int)
+    sharpness = max(float(laplacian[top:bottom, left:right].var())
+                    for top, bottom in zip(rows[:-1], rows[1:]) if bottom > top
+                    for left, right in zip(cols[:-1], cols[1:]) if right > left)
+
+    histogram = np.bincount(small.ravel(), minlength=256)
+    total = max(1, small.size)
+    dark = float(histogram[:DARK_LEVEL + 1].sum()) / total
+    bright = float(histogram[BRIGHT_LEVEL:].sum()) / total
+
+    band_w, band_h = max(1, int(BACKGROUND_WIDTH * w)), max(1, int(BACKGROUND_HEIGHT * h))
+    background = max(float(cv2.meanStdDev(small[:band_h, :band_w])[1][0, 0]),
+                     float(cv2.meanStdDev(small[:band_h, w - band_w:])[1][0, 0]))
+    return {'sharpness': sharpness, 'dark_fraction': dark, 'bright_fraction': bright,
+            'background_std': background}
+
+
+def check_quality(metrics, min_sharpness=None, max_dark_fraction=None, max_bright_fraction=None,
+                  max_background_std=None):
+    """Gibt den Code der ersten fehlgeschlagenen Prüfung zurück (Schwellwert None = deaktiviert)"""
+    if min_sharpness is not None and metrics['sharpness'] < min_sharpness:
+        return QUALITY_BLUR
+    if max_dark_fraction is not None and metrics['dark_fraction'] > max_dark_fraction:
+        return QUALITY_DARK
+    if max_bright_fraction is not None and metrics['bright_fraction'] > max_bright_fraction:
+        return QUALITY_BRIGHT
+    if max_background_std is not None and metrics['background_std'] > max_background_std:
+        return QUALITY_BACKGROUND
+    return QUALITY_OK
+
+
+def quality_message(code, metrics):
+    """Übersetzt einen Qualitätscode in (gültig, Meldung) wie check_biometric_requirements"""
+    if code == QUALITY_BLUR:
+        return False, f"Bild unscharf (Schärfe: {metrics['sharpness']:.1f})"
+    if code == QUALITY_DARK:
+        return False, f"Bild unterbelichtet (Anteil: {metrics['dark_fraction'] * 100:.0f}%)"
+    if code == QUALITY_BRIGHT:
+        return False, f"Bild überbelichtet (Anteil: {metrics['bright_fraction'] * 100:.0f}%)"
+    if code == QUALITY_BACKGROUND:
+        return False, f"Hintergrund nicht einfarbig (Streuung: {metrics['background_std']:.1f})"
+    return True, "OK"
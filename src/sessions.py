@@ -0,0 +1,209 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import cv2
+from geometry import level_transform, warp_window
+from metrics import get_metrics
+from pipeline import PipelineError, PipelineResult, decode_image, locate_face, record_rejection
+
+# Tasten des interaktiven Modus und ihre Wirkung auf die Anpassung
+KEYS = ('left', 'right', 'up', 'down', '+', '-', 'l', 'r')
+
+
+def build_pyramid(image, min_size):
+    """Bildpyramide [(Faktor, Bild), ...] mit cv2.pyrDown, beginnend beim Originalbild.
+
+    Es werden nur Stufen erzeugt, die in beiden Richtungen mindestens min_size
+    (Breite, Höhe) groß sind; kleinere Stufen bringen für die Vorschau nichts.
+    """
+    levels = [(1.0, image)]
+    factor, level = 1.0, image
+    while level.shape[1] // 2 >= min_size[0] and level.shape[0] // 2 >= min_size[1]:
+        level = cv2.pyrDown(level)
+        factor /= 2
+        levels.append((factor, level))
+    return levels
+
+
+class Session:
+    """Dekodiertes Bild, Landmarks und Vorschau-Pyramide einer interaktiven Anpassung"""
+
+    def __init__(self, image, reduction, landmarks, pyramid):
+        self.id = uuid.uuid4().hex
+        self.image = image
+        self.reduction = reduction
+        self.landmarks = landmarks
+        self.pyramid = pyramid
+        # Aktuelle Anpassung, entspricht den Parametern von process_image
+        self.scale_override = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+        self.rotation_angle = 0.0
+        # Anpassungen derselben Sitzung nacheinander ausführen
+        self.lock = threading.Lock()
+        self.last_access = time.monotonic()
+        self.nbytes = sum(level.nbytes for _, level in pyramid)
+
+    def adjustments(self):
+        return {
+            'scale_override': self.scale_override,
+            'offset_x': self.offset_x,
+            'offset_y': self.offset_y,
+            'rotation_angle': self.rotation_angle,
+        }
+
+    def apply_keys(self, processor, keys):
+        """Wendet Tastendrücke wie im interaktiven Modus an (Schrittweiten aus der Konfiguration).
+
+        keys muss eine Liste bekannter Tasten sein; sie wird vollständig geprüft,
+        bevor eine Taste angewendet wird.
+        """
+        if not isinstance(keys, (list, tuple)):
+            raise PipelineError('keys must be a list')
+        for key in keys:
+            if not isinstance(key, str) or key not in KEYS:
+                raise PipelineError(f'Unknown key: {key}')
+        for key in keys:
+            if key == 'left':
+                self.offset_x -= processor.move_step
+            elif key == 'right':
+                self.offset_x += processor.move_step
+            elif key == 'up':
+                self.offset_y -= processor.move_step
+            elif key == 'down':
+                self.offset_y += processor.move_step
+            elif key == '+':
+                self.scale_override *= processor.after_scale_factor
+            elif key == '-':
+                self.scale_override /= processor.after_scale_factor
+            elif key == 'l':
+                self.rotation_angle += processor.rotate_angle
+            elif key == 'r':
+                self.rotation_angle -= processor.rotate_angle
+
+    def set_adjustments(self, scale_override=None, offset_x=None, offset_y=None, rotation_angle=None):
+        """Setzt einzelne Anpassungen absolut (None = unverändert)"""
+        if scale_override is not None:
+            if scale_override <= 0:
+                raise PipelineError('scale_override must be positive')
+            self.scale_override = float(scale_override)
+        if offset_x is not None:
+            self.offset_x = int(offset_x)
+        if offset_y is not None:
+            self.offset_y = int(offset_y)
+        if rotation_angle is not None:
+            self.rotation_angle = float(rotation_angle)
+
+    def render(self, processor, preview=False, preview_quality=80):
+        """Rendert das Ausgabefenster mit der aktuellen Anpassung und kodiert es als JPEG.
+
+        Die Vorschau nutzt die kleinste Pyramidenstufe, die noch mindestens so groß
+        wie das skalierte Bild ist, bilineare Interpolation und eine feste
+        JPEG-Qualität. Ohne preview entspricht das Ergebnis run_pipeline.
+        """
+        matrix, scale = processor.crop_geometry(self.image.shape, self.landmarks, self.scale_override,
+                                                self.offset_x, self.offset_y, self.rotation_angle)
+        if not preview:
+            rendered = processor.render_crop(self.image, matrix)
+            try:
+                encoded = processor.encode_jpeg(rendered, processor.max_file_size)
+            except Exception as e:
+                record_rejection(e)
+                raise
+            return PipelineResult(encoded.buffer, encoded.quality, encoded.attempts, scale / self.reduction)
+
+        with get_metrics().stage('preview'):
+            factor, level = next((f, img) for f, img in reversed(self.pyramid) if f >= scale or f == 1.0)
+            rendered = warp_window(level, level_transform(matrix, factor), processor.target_size,
+                                   interpolation=cv2.INTER_LINEAR)
+            ok, buffer = cv2.imencode('.jpg', rendered, [int(cv2.IMWRITE_JPEG_QUALITY), int(preview_quality)])
+        if not ok:
+            raise PipelineError('Could not encode preview', status=500)
+        return PipelineResult(buffer, int(preview_quality), 1, scale / self.reduction)
+
+
+class SessionStore:
+    """Begrenzter Speicher für Sitzungen: Verdrängung nach Anzahl, Bytes und Inaktivität (TTL)"""
+
+    def __init__(self, max_sessions=16, max_bytes=512 * 1024 * 1024, ttl=300):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._evicted = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Erzeugt den Speicher aus dem Abschnitt 'sessions' der Konfiguration"""
+        return cls(
+            max_sessions=int(config.get('sessions', 'max_sessions')),
+            max_bytes=int(config.get('sessions', 'memory_mb') * 1024 * 1024),
+            ttl=config.get('sessions', 'ttl'),
+        )
+
+    def add(self, session):
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+            self._bytes += session.nbytes
+            # Am längsten ungenutzte Sitzungen verdrängen, die neue Sitzung bleibt immer erhalten
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or
+                                               self._bytes > self.max_bytes):
+                _, evicted = self._sessions.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._evicted += 1
+        return session
+
+    def get(self, session_id):
+        """Gibt die Sitzung zurück und verlängert ihre Lebensdauer (None, wenn unbekannt oder abgelaufen)"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = time.monotonic()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session.nbytes
+            return session is not None
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {'sessions': len(self._sessions), 'bytes': self._bytes, 'evicted': self._evicted}
+
+    def _expire(self):
+        # Inaktive Sitzungen entfernen (Aufruf mit Lock); die Reihenfolge entspricht dem letzten Zugriff
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= session.nbytes
+            self._evicted += 1
+
+
+def create_session(store, processor, data):
+    """Dekodiert das Upload, erkennt das Gesicht und legt eine Sitzung an.
+
+    Abgelehnte Bilder (kein Gesicht, Biometrie-Prüfung) werfen PipelineError wie
+    run_pipeline; Dekodieren und Dlib laufen pro Sitzung nur einmal.
+    """
+    try:
+        decoded, landmarks = locate_face(processor, data, decode_image(data, processor))
+        is_valid, message = processor.check_biometric_requirements(landmarks)
+        if not is_valid:
+            raise PipelineError(f'Biometric check failed: {message}', reason=message)
+    except Exception as e:
+        record_rejection(e)
+        raise
+    pyramid = build_pyramid(decoded.image, processor.target_size)
+    return store.add(Session(decoded.image, decoded.reduction, landmarks, pyramid))
@@ -0,0 +1,195 @@
+"""Bestes Einzelbild aus einem Video für das Passbild.
+
+Das Gesicht wird einmal erkannt und danach mit dlib.correlation_tracker
+verfolgt; neu erkannt wird nur, wenn die Tracking-Güte unter einen Schwellwert
+fällt. Jedes Bild wird mit den biometrischen Prüfungen und der Schärfe bewertet,
+nur das beste Bild läuft durch Zuschnitt und JPEG-Kodierung.
+
+Aufruf:
+    python src/video.py VIDEO AUSGABE.jpg
+"""
+import argparse
+import sys
+import time
+from collections import namedtuple
+
+import cv2
+import dlib
+import numpy as np
+
+from config import Config
+from image_processor import BiometricImageProcessor
+from landmarks import CHECK_OK, Landmarks
+from metrics import get_metrics
+from model_registry import get_registry
+from pipeline import PROCESSOR_OPTIONS, PipelineError, run_pipeline
+
+# Bestes Bild: Bild, Landmarks, Bildnummer, Bewertung sowie Anzahl gelesener Bilder und Erkennungen
+BestFrame = namedtuple('BestFrame', ['image', 'landmarks', 'frame_index', 'score', 'frames', 'detections'])
+
+
+def sharpness(gray, box):
+    """Schärfe als Varianz des Laplace-Operators im Gesichtsbereich"""
+    h, w = gray.shape[:2]
+    left, top = max(0, box.left()), max(0, box.top())
+    right, bottom = min(w, box.right()), min(h, box.bottom())
+    if right - left < 8 or bottom - top < 8:
+        return 0.0
+    return float(cv2.Laplacian(gray[top:bottom, left:right], cv2.CV_32F).var())
+
+
+def frame_score(processor, metrics, sharp):
+    """Bewertung eines Bildes, das alle Prüfungen besteht (höher ist besser).
+
+    Kombiniert Augenöffnung, Kopfneigung, Seitenverhältnis und Mundöffnung
+    relativ zu ihren Schwellwerten mit der Schärfe (logarithmisch, damit sie die
+    Biometrie nicht überstimmt).
+    """
+    config = processor.config
+    eyes = min(float(metrics['left_eye_ratio']), float(metrics['right_eye_ratio']))
+    tilt = abs(float(metrics['head_tilt']))
+    side = abs(float(metrics['side_ratio']) - 1)
+    mouth = max(0.0, float(metrics['mouth_gap']))
+    return (eyes / config.get('biometric_checks', 'min_eye_ratio')
+            - tilt / config.get('biometric_checks', 'max_head_tilt')
+            - side / config.get('biometric_checks', 'side_ratio_tolerance')
+            - mouth / config.get('biometric_checks', 'max_mouth_gap')
+            + np.log1p(sharp))
+
+
+class FaceTracker:
+    """Verfolgt ein Gesicht über die Bilder eines Videos auf einer verkleinerten Kopie.
+
+    Erkannt wird mit dem Detektor des Prozessors nur beim ersten Bild und wenn
+    die Tracking-Güte (Peak-to-Sidelobe-Ratio) unter min_psr fällt.
+    """
+
+    def __init__(self, processor, min_psr=7.0, max_size=640):
+        self.processor = processor
+        self.min_psr = min_psr
+        self.max_size = max_size
+        self.detections = 0
+        self._tracker = None
+
+    def update(self, gray):
+        """Gibt die Gesichtsbox in Koordinaten von gray zurück (None, wenn kein Gesicht gefunden wird)"""
+        h, w = gray.shape[:2]
+        factor = min(1.0, self.max_size / max(h, w))
+        proxy = cv2.resize(gray, (int(round(w * factor)), int(round(h * factor))),
+                           interpolation=cv2.INTER_AREA) if factor < 1.0 else gray
+
+        box = None
+        if self._tracker is not None:
+            with get_metrics().stage('track'):
+                psr = self._tracker.update(proxy)
+            if psr >= self.min_psr:
+                box = self._tracker.get_position()
+        if box is None:
+            # Neu erkennen: erstes Bild oder Tracking verloren
+            self.detections += 1
+            faces = self.processor.detect_faces(gray)
+            if len(faces) == 0:
+                self._tracker = None
+                return None
+            face = faces[0]
+            box = dlib.rectangle(int(face.left() * factor), int(face.top() * factor),
+                                 int(face.right() * factor), int(face.bottom() * factor))
+            self._tracker = dlib.correlation_tracker()
+            self._tracker.start_track(proxy, box)
+
+        return dlib.rectangle(int(round(box.left() / factor)), int(round(box.top() / factor)),
+                              int(round(box.right() / factor)), int(round(box.bottom() / factor)))
+
+
+def find_best_frame(processor, path, frame_step=1, min_psr=7.0, max_frames=0):
+    """Liest ein Video und gibt das beste Bild als BestFrame zurück.
+
+    Bilder, die eine Prüfung nicht bestehen, werden nur gewählt, wenn kein Bild
+    alle Prüfungen besteht (dann das mit der höchsten Schärfe). Wirft
+    PipelineError, wenn das Video nicht lesbar ist oder kein Gesicht enthält.
+    """
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise PipelineError(f'Could not open video: {path}')
+
+    metrics = get_metrics()
+    tracker = FaceTracker(processor, min_psr=min_psr,
+                          max_size=int(processor.config.get('face_detection', 'detection_max_size')) or 640)
+    best = None
+    best_key = None
+    index = frames = 0
+    try:
+        while not max_frames or frames < max_frames:
+            # Übersprungene Bilder nur weiterschalten, nicht dekodieren
+            if index % frame_step and capture.grab():
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames += 1
+            with metrics.stage('grayscale'):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            box = tracker.update(gray)
+            if box is not None:
+                with metrics.stage('landmarks'):
+                    landmarks = Landmarks.from_shape(processor.predictor(gray, box))
+                codes, face = processor.check_biometric_requirements_batch(landmarks.points[None])
+                face = {key: value[0] for key, value in face.items()}
+                sharp = sharpness(gray, box)
+                passed = int(codes[0]) == CHECK_OK
+                key = (passed, frame_score(processor, face, sharp) if passed else sharp)
+                if best_key is None or key > best_key:
+                    best_key = key
+                    best = (frame, landmarks, index, key[1])
+            index += 1
+    finally:
+        capture.release()
+
+    if best is None:
+        raise PipelineError('No face detected')
+    frame, landmarks, frame_index, score = best
+    return BestFrame(frame, landmarks, frame_index, score, frames, tracker.detections)
+
+
+def process_video(processor, path, **options):
+    """Wählt das beste Bild eines Videos und verarbeitet es wie ein Foto.
+
+    Gibt (PipelineResult, BestFrame) zurück; die Prüfungen laufen für das
+    gewählte Bild erneut, ein Video ohne gültiges Bild wird daher abgelehnt.
+    """
+    best = find_best_frame(processor, path, **options)
+    return run_pipeline(processor, best.image, 1, best.landmarks), best
+
+
+def main(argv=None):
+    config = Config()
+    parser = argparse.ArgumentParser(description="Erzeugt ein Passbild aus dem besten Bild eines Videos")
+    parser.add_argument("video", help="Videodatei")
+    parser.add_argument("output", help="Ausgabedatei (JPEG)")
+    parser.add_argument("--frame-step", type=int, default=config.get('video', 'frame_step'),
+                        help="Nur jedes N-te Bild auswerten")
+    parser.add_argument("--max-frames", type=int, default=config.get('video', 'max_frames'),
+                        help="Höchstens so viele Bilder auswerten (0 = alle)")
+    args = parser.parse_args(argv)
+
+    processor = BiometricImageProcessor(config=config, models=get_registry().load(), **PROCESSOR_OPTIONS)
+    start = time.perf_counter()
+    try:
+        result, best = process_video(processor, args.video, frame_step=max(1, args.frame_step),
+                                     min_psr=config.get('video', 'min_tracking_psr'), max_frames=args.max_frames)
+    except PipelineError as e:
+        print(f"Abgelehnt: {e}")
+        return 1
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, 'wb') as f:
+        f.write(result.buffer.tobytes())
+    rate = best.frames / elapsed if elapsed > 0 else 0.0
+    print(f"Bild {best.frame_index} gewählt (Bewertung {best.score:.2f}), {best.frames} Bilder "
+          f"mit {best.detections} Erkennungen in {elapsed:.1f}s ({rate:.1f} Bilder/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""HTTP-Grenzen der Weboberfläche: Uploadgrößen und Fehlerantworten als JSON."""
+import io
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("dlib")
+
+import app as flask_app  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return flask_app.app.test_client()
+
+
+def _megabytes(key):
+    return int(flask_app.config.get('decode', key) * 1024 * 1024)
+
+
+def test_batch_over_total_limit_is_rejected(client):
+    size = _megabytes('max_batch_mb') // 2 + 1
+    files = [(io.BytesIO(b'\0' * size), 'a.jpg'), (io.BytesIO(b'\0' * size), 'b.jpg')]
+    response = client.post('/process/batch', data={'files': files}, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert response.get_json() == {'error': 'Upload too large'}
+
+
+def test_request_limit_covers_single_and_batch_uploads():
+    limit = flask_app.app.config['MAX_CONTENT_LENGTH']
+    assert limit is not None
+    assert limit >= max(_megabytes('max_upload_mb'), _megabytes('max_batch_mb'))
+
+
+def test_batch_reads_uploads_while_streaming(client, monkeypatch):
+    # Für das Dekodieren genügen Konfiguration und Ziel-Gesichtshöhe, Dlib wird nicht erreicht
+    monkeypatch.setattr(flask_app, '_create_processor',
+                        lambda: SimpleNamespace(config=flask_app.config, target_face_height=480.0))
+    monkeypatch.setattr(flask_app, 'result_cache', None)
+    files = [(io.BytesIO(b'kein Bild'), 'a.jpg'), (io.BytesIO(b'auch keins'), 'b.jpg')]
+    response = client.post('/process/batch', data={'files': files}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    body = response.get_data()
+    assert body.count(b'Could not decode image') == 2
+    assert b'"file": "a.jpg"' in body and b'"file": "b.jpg"' in body
+
+
+def test_body_without_content_length_is_capped(client, monkeypatch):
+    # Kleine Grenze für den Test; ohne Content-Length greift nur MAX_CONTENT_LENGTH
+    monkeypatch.setitem(flask_app.app.config, 'MAX_CONTENT_LENGTH', 64 * 1024)
+    boundary = 'grenze'
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode('utf-8') + b'\0' * (256 * 1024) +
+            f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    response = client.post('/process', input_stream=io.BytesIO(body),
+                           content_type=f'multipart/form-data; boundary={boundary}',
+                           headers={'Transfer-Encoding': 'chunked'},
+                           environ_overrides={'wsgi.input_terminated': True})
+    assert response.status_code == 413
+    assert response.get_json() == {'error': 'Upload too large'}
+
+
+def _broken_models(*args, **kwargs):
+    raise FileNotFoundError('shape_predictor_68_face_landmarks.dat')
+
+
+def _upload():
+    return (io.BytesIO(b'kein Bild'), 'a.jpg')
+
+
+def test_profiles_report_model_errors_as_json(client, monkeypatch):
+    monkeypatch.setattr(flask_app, 'BiometricImageProcessor', _broken_models)
+    response = client.post('/process/profiles', data={'file': _upload()}, content_type='multipart/form-data')
+    assert response.status_code == 500
+    assert 'Dlib model error' in response.get_json()['error']
+
+
+def test_unknown_profile_is_rejected(client):
+    response = client.post('/process/profiles', data={'file': _upload(), 'profiles': 'gibt-es-nicht'},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unknown profile: gibt-es-nicht'}
+
+
+def test_session_render_reports_model_errors_as_json(client, monkeypatch):
+    import numpy as np
+    from sessions import Session
+
+    image = np.zeros((8, 8, 3), np.uint8)
+    session = flask_app.session_store.add(Session(image, 1, None, [(1.0, image)]))
+    monkeypatch.setattr(flask_app, 'BiometricImageProcessor', _broken_models)
+    try:
+        response = client.post(f'/sessions/{session.id}/adjust', json={'keys': ['left']})
+    finally:
+        flask_app.session_store.remove(session.id)
+    assert response.status_code == 500
+    assert 'Dlib model error' in response.get_json()['error']
+
+
+def test_batch_reports_model_errors_as_json(client, monkeypatch):
+    monkeypatch.setattr(flask_app, 'BiometricImageProcessor', _broken_models)
+    response = client.post('/process/batch', data={'files': [_upload()]}, content_type='multipart/form-data')
+    assert response.status_code == 500
+    assert 'Dlib model error' in response.get_json()['error']
@@ -0,0 +1,48 @@
+"""Ordnerverarbeitung: eindeutige Ausgabenamen und Schreibfehler pro Datei."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dlib")
+
+import batch  # noqa: E402
+
+
+def test_same_stem_in_different_formats_gets_distinct_outputs(tmp_path):
+    for name in ('a.jpg', 'a.png', 'a.JPG', 'a_png.jpg', 'notiz.txt'):
+        (tmp_path / name).write_bytes(b'')
+    targets = [target for _, target in batch.iter_pending(str(tmp_path), str(tmp_path / 'out'), 'bio_')]
+    assert len(targets) == 4
+    assert len(set(targets)) == len(targets)
+    assert str(tmp_path / 'out' / 'bio_a_png.jpg') in targets
+
+
+def test_existing_output_is_skipped_on_resume(tmp_path):
+    (tmp_path / 'a.jpg').write_bytes(b'')
+    (tmp_path / 'a.png').write_bytes(b'')
+    output = tmp_path / 'out'
+    output.mkdir()
+    batch.output_path_for('a.png', output).write_bytes(b'')
+    pending = list(batch.iter_pending(str(tmp_path), str(output)))
+    assert [source for source, _ in pending] == [str(tmp_path / 'a.jpg')]
+
+
+def test_write_failure_is_reported_for_the_file(tmp_path, monkeypatch):
+    source = tmp_path / 'a.jpg'
+    source.write_bytes(b'')
+    # Erkennung und Pipeline überspringen, nur das Schreiben wird geprüft
+    monkeypatch.setattr(batch, 'decode_image', lambda data, processor: None)
+    monkeypatch.setattr(batch, 'locate_face',
+                        lambda processor, data, decoded: (SimpleNamespace(image=None, reduction=1), None))
+    monkeypatch.setattr(batch, 'run_pipeline', lambda *args: SimpleNamespace(buffer=np.zeros(4, np.uint8)))
+
+    target = tmp_path / 'fehlt' / 'a_jpg.jpg'
+    path, ok, message = batch._process_file(str(source), str(target))
+    assert (path, ok) == (str(source), False)
+    assert message.startswith('Fehler beim Schreiben')
+
+    target = tmp_path / 'a_jpg.jpg'
+    assert batch._process_file(str(source), str(target))[1:] == (True, 'OK')
+    assert target.read_bytes() == b'\0' * 4
+    assert list(tmp_path.glob('*.part')) == []
@@ -0,0 +1,68 @@
+"""Festplatten-Cache: gleichzeitige Schreiber, unlesbare Einträge und kein Pickle."""
+import threading
+
+import numpy as np
+
+from cache import ResultCache
+from pipeline import CachedRejection, PipelineResult
+
+
+def _result(size=2000):
+    buffer = np.arange(size, dtype=np.uint32).astype(np.uint8).reshape(-1, 1)
+    return PipelineResult(buffer, 87, 3, 0.5)
+
+
+def _disk_only(tmp_path, **kwargs):
+    # Speicher-Ebene ohne Platz, damit jeder Zugriff die Festplatte erreicht
+    return ResultCache(memory_entries=0, disk_dir=str(tmp_path), **kwargs)
+
+
+def test_result_and_rejection_round_trip(tmp_path):
+    cache = _disk_only(tmp_path)
+    cache.put_result('a', _result())
+    cache.put_result('b', CachedRejection('No face detected', 400, 'No face detected'))
+
+    loaded = cache.get_result('a')
+    assert isinstance(loaded, PipelineResult)
+    assert loaded.buffer.tobytes() == _result().buffer.tobytes()
+    assert (loaded.quality, loaded.attempts, loaded.scale) == (87, 3, 0.5)
+    assert cache.get_result('b') == CachedRejection('No face detected', 400, 'No face detected')
+
+
+def test_concurrent_puts_of_one_key_do_not_fail(tmp_path):
+    cache = _disk_only(tmp_path)
+    errors = []
+
+    def writer():
+        try:
+            for _ in range(50):
+                cache.put_result('same', _result())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.get_result('same').buffer.tobytes() == _result().buffer.tobytes()
+    assert list(tmp_path.glob('*.part')) == []
+
+
+def test_unreadable_or_stale_entries_are_misses(tmp_path):
+    cache = _disk_only(tmp_path)
+    (tmp_path / 'garbage.entry').write_bytes(b'\x80\x04\x95 kein JSON')
+    (tmp_path / 'stale.entry').write_bytes(b'{"type": "result", "quality": 90}\n\xff\xd8')
+    (tmp_path / 'unknown.entry').write_bytes(b'{"type": "landmarks"}\n')
+    for key in ('garbage', 'stale', 'unknown', 'missing'):
+        assert cache.get_result(key) is None
+
+
+def test_disk_size_limit_evicts_oldest(tmp_path):
+    cache = _disk_only(tmp_path, disk_bytes=5000)
+    for key in ('a', 'b', 'c'):
+        cache.put_result(key, _result())
+    assert cache.get_result('a') is None
+    assert cache.get_result('c') is not None
+    assert sum(p.stat().st_size for p in tmp_path.glob('*.entry')) <= 5000
@@ -0,0 +1,86 @@
+"""Dekodieren: Bildgröße aus dem Header und keine Hochskalierung kleiner Gesichter nach verkleinertem Dekodieren."""
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from config import Config
+from decoding import read_image_size
+from landmarks import CHIN, LEFT_EYE, RIGHT_EYE, Landmarks
+from pipeline import PipelineError, decode_image, refine_reduction
+
+
+def _processor(target_face_height):
+    config = Config()
+    return SimpleNamespace(config=config, target_face_height=target_face_height, target_size=(413, 531),
+                           chin_to_eye_factor=config.get('biometric_checks', 'chin_to_eye_factor'))
+
+
+def _upload(width=1600, height=1200):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def _landmarks(eye_y, chin_y, center_x=400.0):
+    points = np.full((68, 2), center_x, dtype=np.float32)
+    points[:, 1] = (eye_y + chin_y) / 2
+    points[LEFT_EYE] = (center_x - 40, eye_y)
+    points[RIGHT_EYE] = (center_x + 40, eye_y)
+    points[CHIN] = (center_x, chin_y)
+    return Landmarks(points)
+
+
+def test_small_face_is_decoded_again_at_full_resolution():
+    processor = _processor(target_face_height=100.0)
+    data = _upload()
+    decoded = decode_image(data, processor)
+    # 1200 * 0.25 / 2 >= 100: ohne Gesicht wird halbiert dekodiert
+    assert decoded.reduction == 2 and decoded.image.shape[:2] == (600, 800)
+
+    # Gesichtshöhe im halbierten Bild unter dem Ziel, in voller Auflösung darüber
+    factor = processor.chin_to_eye_factor
+    landmarks = _landmarks(200.0, 200.0 + 70.0 / factor)
+    refined, scaled = refine_reduction(processor, data, decoded, landmarks)
+
+    assert refined.reduction == 1 and refined.image.shape[:2] == (1200, 1600)
+    height = np.linalg.norm(scaled.chin - scaled.eyes_center) * factor
+    assert abs(height - 140.0) < 0.01
+    assert abs(scaled.eyes_center[1] - 400.5) < 0.01
+
+
+def test_large_enough_face_keeps_reduction():
+    processor = _processor(target_face_height=100.0)
+    data = _upload()
+    decoded = decode_image(data, processor)
+    landmarks = _landmarks(200.0, 200.0 + 120.0 / processor.chin_to_eye_factor)
+    refined, same = refine_reduction(processor, data, decoded, landmarks)
+    assert refined is decoded and same is landmarks
+
+
+@pytest.mark.parametrize("extension", ['.jpg', '.png', '.bmp', '.webp'])
+def test_image_size_is_read_from_the_header(extension):
+    image = np.zeros((37, 53, 3), dtype=np.uint8)
+    ok, buffer = cv2.imencode(extension, image)
+    if not ok:
+        pytest.skip(f"OpenCV ohne {extension}-Kodierer")
+    assert read_image_size(buffer.tobytes()) == (53, 37)
+
+
+def test_lossless_webp_size_is_read_from_the_header():
+    ok, buffer = cv2.imencode('.webp', np.zeros((37, 53, 3), dtype=np.uint8), [cv2.IMWRITE_WEBP_QUALITY, 101])
+    if not ok:
+        pytest.skip("OpenCV ohne WebP-Kodierer")
+    assert buffer.tobytes()[12:16] == b'VP8L'
+    assert read_image_size(buffer.tobytes()) == (53, 37)
+
+
+def test_oversized_bmp_is_rejected_before_decoding(monkeypatch):
+    processor = _processor(target_face_height=100.0)
+    monkeypatch.setitem(processor.config.settings.setdefault('decode', {}), 'max_megapixels', 0.001)
+    ok, buffer = cv2.imencode('.bmp', np.zeros((100, 100, 3), dtype=np.uint8))
+    monkeypatch.setattr(cv2, 'imdecode', lambda *args: pytest.fail("decoded before the pixel check"))
+    with pytest.raises(PipelineError) as error:
+        decode_image(buffer.tobytes(), processor)
+    assert error.value.status == 413
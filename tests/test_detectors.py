@@ -0,0 +1,90 @@
+"""Detektor-Backends: Modelle einmal pro Prozess laden."""
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("dlib")
+
+from detectors import HaarDetector, _InstancePool  # noqa: E402
+
+
+def _in_new_thread(function):
+    # Wie Werkzeugs Server mit einem neuen Thread pro Anfrage; Fehler im Thread an den Test weitergeben
+    errors = []
+
+    def run():
+        try:
+            function()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+def test_pool_reuses_instances_across_threads():
+    loads = []
+    pool = _InstancePool(lambda: loads.append(1) or object())
+
+    def use():
+        with pool.borrow():
+            pass
+
+    for _ in range(5):
+        _in_new_thread(use)
+    assert len(loads) == 1
+
+
+def test_pool_loads_extra_instance_only_while_busy():
+    loads = []
+    pool = _InstancePool(lambda: loads.append(1) or len(loads))
+    with pool.borrow() as first, pool.borrow() as second:
+        assert first != second
+    with pool.borrow(), pool.borrow():
+        pass
+    assert len(loads) == 2
+
+
+def test_haar_classifier_is_not_reloaded_per_thread(monkeypatch):
+    model = Path(cv2.data.haarcascades) / 'haarcascade_frontalface_default.xml'
+    if not model.exists():
+        pytest.skip("OpenCV ohne Haar-Cascades")
+    detector = HaarDetector(model)
+    loads = []
+    original = cv2.CascadeClassifier
+    monkeypatch.setattr(cv2, 'CascadeClassifier', lambda path: loads.append(path) or original(path))
+
+    gray = np.full((120, 160), 128, dtype=np.uint8)
+    for _ in range(3):
+        _in_new_thread(lambda: detector(gray))
+    assert loads == []
+
+
+def test_cascade_reports_each_face_once_largest_first():
+    import dlib
+    from detectors import CascadeDetector
+
+    faces = [(100, 100, 200, 200), (260, 110, 320, 170)]
+
+    def proposer(gray, upsample=1):
+        # Zwei überlappende Vorschläge für das erste Gesicht, einer für das zweite daneben
+        return dlib.rectangles([dlib.rectangle(95, 95, 195, 195), dlib.rectangle(105, 100, 205, 200),
+                                dlib.rectangle(255, 105, 325, 175)])
+
+    def verifier(region, upsample=1):
+        # Jedes Pixel enthält seine Koordinaten, so findet der Prüfer die Lage der Region im Bild
+        top, left = divmod(int(region[0, 0]), 1000)
+        h, w = region.shape[:2]
+        return dlib.rectangles([dlib.rectangle(l - left, t - top, r - left, b - top) for l, t, r, b in faces
+                                if l >= left and t >= top and r <= left + w and b <= top + h])
+
+    y, x = np.mgrid[:400, :500]
+    detector = CascadeDetector(proposer, verifier, padding=0.8)
+    boxes = [(r.left(), r.top(), r.right(), r.bottom()) for r in detector(y * 1000 + x)]
+    assert boxes == faces
@@ -0,0 +1,101 @@
+"""Regressionstest: der Zuschnitt per Affine entspricht dem früheren Ablauf (drehen, skalieren, ausschneiden)."""
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("dlib")
+
+from config import Config  # noqa: E402
+from image_processor import BiometricImageProcessor  # noqa: E402
+from landmarks import Landmarks  # noqa: E402
+from pipeline import PROCESSOR_OPTIONS  # noqa: E402
+
+
+class _NoModels:
+    # Für den Zuschnitt werden keine Dlib-Modelle benötigt
+    predictor = None
+    detector = None
+
+
+def _processor():
+    return BiometricImageProcessor(config=Config(), models=_NoModels(), **PROCESSOR_OPTIONS)
+
+
+def _textured_image(width, height, seed=0):
+    """Glattes, strukturiertes Testbild, damit die Phasenkorrelation eindeutig ist"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC), (0, 0), 2)
+
+
+def _face(center_x, eye_y, chin_y):
+    """68 Landmarks mit Augen bei eye_y und Kinn bei chin_y (nur Augen und Kinn sind für den Zuschnitt relevant)"""
+    points = np.tile([center_x, (eye_y + chin_y) / 2], (68, 1)).astype(np.float64)
+    points[36:42] = [center_x - 40, eye_y]
+    points[42:48] = [center_x + 40, eye_y]
+    points[8] = [center_x, chin_y]
+    return Landmarks(points)
+
+
+def _reference_crop(processor, image, landmarks, scale_override=None, offset_x=0, offset_y=0, rotation_angle=0):
+    """Früherer process_image-Ablauf: ganzes Bild drehen und skalieren, dann ausschneiden"""
+    target_w, target_h = processor.target_size
+    if rotation_angle != 0:
+        center = (image.shape[1] // 2, image.shape[0] // 2)
+        rot_mat = cv2.getRotationMatrix2D(center, rotation_angle, 1.0)
+        image = cv2.warpAffine(image, rot_mat, (image.shape[1], image.shape[0]))
+
+    chin = landmarks.chin.astype(np.float64)
+    eyes_center = landmarks.eyes_center.astype(np.float64)
+    face_height = np.linalg.norm(chin - eyes_center) * processor.chin_to_eye_factor
+    scale = processor.target_face_height / face_height
+    if scale_override is not None:
+        scale *= scale_override
+    scaled = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LANCZOS4)
+
+    chin_target_y = target_h * (1 - processor.chin_hight_factor)
+    crop_top = int(round(chin[1] * scale - chin_target_y)) + offset_y
+    crop_left = int(round(eyes_center[0] * scale)) + offset_x - target_w // 2
+    h_s, w_s = scaled.shape[:2]
+    crop_top = min(max(crop_top, 0), h_s - target_h)
+    crop_left = min(max(crop_left, 0), w_s - target_w)
+    return scaled[crop_top:crop_top + target_h, crop_left:crop_left + target_w]
+
+
+def _shift(a, b):
+    """Verschiebung zwischen zwei Bildern in Pixel (Phasenkorrelation)"""
+    gray_a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gray_b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    (dx, dy), _ = cv2.phaseCorrelate(gray_a, gray_b)
+    return float(np.hypot(dx, dy))
+
+
+@pytest.mark.parametrize("size, face, adjust", [
+    # Standardfall und Offsets
+    ((900, 1200), (450, 500, 780), {}),
+    ((900, 1200), (450, 500, 780), {'offset_x': 17, 'offset_y': -23}),
+    # Manuelle Skalierung
+    ((900, 1200), (450, 500, 780), {'scale_override': 1.08}),
+    ((900, 1200), (450, 500, 780), {'scale_override': 0.93, 'offset_x': -11}),
+    # Rotation um die Bildmitte
+    ((900, 1200), (450, 500, 780), {'rotation_angle': 3}),
+    ((900, 1200), (440, 520, 790), {'rotation_angle': -2, 'offset_y': 9}),
+    # Zuschnitt am linken, rechten, oberen und unteren Bildrand
+    ((900, 1200), (160, 500, 780), {}),
+    ((900, 1200), (760, 500, 780), {}),
+    ((900, 1200), (450, 500, 780), {'offset_y': -400}),
+    ((900, 1200), (450, 500, 780), {'offset_y': 400}),
+    # Großes Bild
+    ((3000, 4000), (1500, 1700, 2500), {'offset_x': 5, 'scale_override': 1.03}),
+])
+def test_crop_matches_previous_pipeline(size, face, adjust):
+    processor = _processor()
+    image = _textured_image(*size)
+    landmarks = _face(*face)
+
+    result = processor.process_image(image, landmarks, **adjust)
+    expected = _reference_crop(processor, image, landmarks, **adjust)
+
+    assert result.shape == expected.shape == (processor.target_size[1], processor.target_size[0], 3)
+    # Gefordert ist höchstens ein Pixel; gemessen werden ca. 0.01 px, daher deutlich strenger prüfen
+    assert _shift(result, expected) < 0.1
@@ -0,0 +1,32 @@
+"""Auftragsverwaltung: abgelaufene Ergebnisse werden entfernt, auch ohne neue Aufträge."""
+import time
+
+from jobs import DONE, JobManager
+
+
+def _finished(manager, payload):
+    job = manager.submit(payload)
+    deadline = time.monotonic() + 10
+    while job.finished_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == DONE
+    return job
+
+
+def test_expired_result_is_not_served():
+    manager = JobManager(lambda payload: payload * 2, workers=1, result_ttl=60)
+    job = _finished(manager, 21)
+    assert manager.get(job.id).result == 42
+
+    # Ablauf simulieren, ohne dass danach ein weiterer Auftrag eingereicht wird
+    job.finished_at -= 61
+    assert manager.get(job.id) is None
+
+
+def test_idle_workers_sweep_expired_results():
+    manager = JobManager(lambda payload: b'\xff' * 1024, workers=1, result_ttl=0.1)
+    job = _finished(manager, None)
+    deadline = time.monotonic() + 5
+    while job.id in manager._jobs and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.id not in manager._jobs
@@ -0,0 +1,96 @@
+"""Binärsuche der JPEG-Qualität: gleiche Wahl wie die frühere schrittweise Reduktion."""
+import cv2
+import numpy as np
+import pytest
+
+from config import DEFAULT_CONFIG
+from jpeg_encoder import JpegSizeError, QualityPredictor, encode_to_size
+
+QUALITY = DEFAULT_CONFIG['image_quality']
+MIN_QUALITY = int(QUALITY['min_jpeg_quality'])
+MAX_QUALITY = int(QUALITY['start_jpeg_quality'])
+STEP = int(QUALITY['quality_step'])
+
+
+def _linear_search(image, max_size, min_quality=MIN_QUALITY, max_quality=MAX_QUALITY, step=STEP):
+    """Früheres adjust_jpeg_quality: Qualität schrittweise senken, bis die Datei passt"""
+    quality = max_quality
+    while quality > min_quality:
+        _, encoded = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if encoded.nbytes <= max_size:
+            return encoded, quality
+        quality -= step
+    return encoded, None
+
+
+def _crop(seed, detail):
+    """Passbildgroßer Ausschnitt mit unterschiedlich viel Struktur"""
+    rng = np.random.default_rng(seed)
+    cells = rng.integers(0, 256, (531 // detail + 1, 413 // detail + 1, 3), dtype=np.uint8)
+    image = cv2.resize(cells, (413, 531), interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 4 + seed % 5, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def _sizes(image):
+    # Zielgrößen zwischen den Dateigrößen bei minimaler und maximaler Qualität
+    sizes = [cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), q])[1].nbytes
+             for q in (MAX_QUALITY, MIN_QUALITY + STEP)]
+    return [int(sizes[1] + (sizes[0] - sizes[1]) * f) for f in (0.1, 0.5, 0.9)]
+
+
+CROPS = [(seed, detail) for seed in range(8) for detail in (4, 16, 64)]
+
+
+@pytest.mark.parametrize("seed, detail", CROPS)
+def test_matches_linear_search(seed, detail):
+    image = _crop(seed, detail)
+    for max_size in _sizes(image):
+        expected, quality = _linear_search(image, max_size)
+        result = encode_to_size(image, max_size, MIN_QUALITY, MAX_QUALITY, STEP, predictor=QualityPredictor())
+        assert result.quality == quality
+        assert result.buffer.tobytes() == expected.tobytes()
+        assert result.attempts <= 2 + int(np.ceil(np.log2(len(range(MAX_QUALITY, MIN_QUALITY, -STEP)) + 1)))
+
+
+@pytest.mark.parametrize("predicted", [MAX_QUALITY, MIN_QUALITY, 75])
+def test_predicted_start_miss_still_finds_linear_choice(predicted):
+    image = _crop(3, 16)
+    max_size = _sizes(image)[1]
+    _, quality = _linear_search(image, max_size)
+    predictor = QualityPredictor()
+    # Vorhersage aus einer anderen Bildserie gleicher Größe, liegt hier daneben
+    predictor.record((max_size, image.shape), predicted)
+    result = encode_to_size(image, max_size, MIN_QUALITY, MAX_QUALITY, STEP, predictor=predictor)
+    assert result.quality == quality
+
+
+def test_correct_prediction_needs_at_most_two_encodes():
+    image = _crop(5, 16)
+    max_size = _sizes(image)[1]
+    predictor = QualityPredictor()
+    first = encode_to_size(image, max_size, MIN_QUALITY, MAX_QUALITY, STEP, predictor=predictor)
+    second = encode_to_size(image, max_size, MIN_QUALITY, MAX_QUALITY, STEP, predictor=predictor)
+    assert second.quality == first.quality
+    assert second.attempts <= 2
+
+
+def test_unreachable_size_raises():
+    image = _crop(1, 4)
+    smallest = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), MIN_QUALITY])[1].nbytes
+    # Die frühere Schleife lieferte hier stillschweigend eine zu große Datei
+    oversized, quality = _linear_search(image, smallest - 1)
+    assert quality is None and oversized.nbytes > smallest - 1
+
+    with pytest.raises(JpegSizeError) as error:
+        encode_to_size(image, smallest - 1, MIN_QUALITY, MAX_QUALITY, STEP, predictor=QualityPredictor())
+    assert error.value.smallest_size == smallest
+    assert error.value.min_quality == MIN_QUALITY
+
+
+def test_min_quality_is_used_when_only_it_fits():
+    image = _crop(2, 4)
+    smallest = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), MIN_QUALITY])[1].nbytes
+    result = encode_to_size(image, smallest, MIN_QUALITY, MAX_QUALITY, STEP, predictor=QualityPredictor())
+    assert result.quality == MIN_QUALITY
+    assert result.buffer.nbytes == smallest
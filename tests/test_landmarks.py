@@ -0,0 +1,151 @@
+"""Vektorisierte Biometrie-Prüfungen: gleiche Meldungen wie die früheren Einzelprüfungen, auch im Stapel."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dlib")
+
+from config import Config  # noqa: E402
+from image_processor import BiometricImageProcessor  # noqa: E402
+from landmarks import CHECK_OK, Landmarks, check_faces  # noqa: E402
+
+CHECKS = ('side_ratio_check', 'head_tilt_check', 'mouth_check', 'eye_check')
+
+
+class _NoModels:
+    predictor = None
+    detector = None
+
+
+class _Shape:
+    """Minimaler Ersatz für dlib.full_object_detection (ganzzahlige Punkte wie bei Dlib)"""
+
+    def __init__(self, points):
+        self._points = [SimpleNamespace(x=int(x), y=int(y)) for x, y in points]
+
+    def part(self, index):
+        return self._points[index]
+
+    def parts(self):
+        return self._points
+
+
+def _reference_check(shape, config, side_ratio_check, head_tilt_check, mouth_check, eye_check):
+    """Frühere check_biometric_requirements-Prüfungen mit shape.part() und Python-Schleifen"""
+    def eye_aspect_ratio(eye_points):
+        points = np.array([(p.x, p.y) for p in eye_points])
+        a = np.linalg.norm(points[1] - points[5])
+        b = np.linalg.norm(points[2] - points[4])
+        c = np.linalg.norm(points[0] - points[3])
+        return (a + b) / (2.0 * c)
+
+    if side_ratio_check:
+        left = np.linalg.norm(np.array([shape.part(36).x, shape.part(36).y]) -
+                              np.array([shape.part(31).x, shape.part(31).y]))
+        right = np.linalg.norm(np.array([shape.part(45).x, shape.part(45).y]) -
+                               np.array([shape.part(35).x, shape.part(35).y]))
+        side_ratio = left / right
+        tolerance = config.get('biometric_checks', 'side_ratio_tolerance')
+        if side_ratio < (1 - tolerance) or side_ratio > (1 + tolerance):
+            return False, f"Kopf nicht frontal ausgerichtet (Verhältnis: {side_ratio:.2f})"
+    if head_tilt_check:
+        left_eye = np.mean([(shape.part(36 + i).x, shape.part(36 + i).y) for i in range(6)], axis=0)
+        right_eye = np.mean([(shape.part(42 + i).x, shape.part(42 + i).y) for i in range(6)], axis=0)
+        angle = np.degrees(np.arctan2(right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]))
+        if abs(angle) > config.get('biometric_checks', 'max_head_tilt'):
+            return False, f"Kopfneigung zu stark: {angle:.1f}°"
+    if mouth_check:
+        if shape.part(66).y - shape.part(62).y > config.get('biometric_checks', 'max_mouth_gap'):
+            return False, "Mund muss geschlossen sein"
+    if eye_check:
+        left_ratio = eye_aspect_ratio([shape.part(i) for i in range(36, 42)])
+        right_ratio = eye_aspect_ratio([shape.part(i) for i in range(42, 48)])
+        if left_ratio < config.get('biometric_checks', 'min_eye_ratio') or \
+                right_ratio < config.get('biometric_checks', 'min_eye_ratio'):
+            return False, "Augen müssen geöffnet sein"
+    return True, "OK"
+
+
+def _template():
+    """Frontales Gesicht mit Augen, Nase und Mund an plausiblen Stellen (ca. 200 Pixel breit)"""
+    points = np.zeros((68, 2))
+    points[0:17] = np.stack([np.linspace(-100, 100, 17), 60 - 60 * np.cos(np.linspace(0, np.pi, 17))], axis=1)
+    points[17:27] = np.stack([np.linspace(-80, 80, 10), np.full(10, -50)], axis=1)
+    points[27:31] = np.stack([np.zeros(4), np.linspace(-30, 20, 4)], axis=1)
+    points[31:36] = np.stack([np.linspace(-20, 20, 5), np.full(5, 30)], axis=1)
+    for start, cx in ((36, -45), (42, 45)):
+        # Außenwinkel, zwei Punkte oben, Innenwinkel, zwei Punkte unten
+        points[start:start + 6] = [(cx - 20, -20), (cx - 7, -27), (cx + 7, -27), (cx + 20, -20),
+                                   (cx + 7, -13), (cx - 7, -13)]
+    mouth = np.linspace(0, 2 * np.pi, 12, endpoint=False)
+    points[48:60] = np.stack([35 * np.cos(mouth), 70 + 12 * np.sin(mouth)], axis=1)
+    inner = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+    points[60:68] = np.stack([25 * np.cos(inner), 70 + 4 * np.sin(inner)], axis=1)
+    return points
+
+
+def _perturbed_shapes(count=2000, seed=0):
+    """Zufällig gedrehte, verschobene und verformte Gesichter, viele davon nahe an den Schwellwerten"""
+    rng = np.random.default_rng(seed)
+    base = _template()
+    shapes = []
+    for _ in range(count):
+        points = base.copy()
+        # Augen schließen, Mund öffnen, Nase seitlich verschieben (Seitenverhältnis)
+        points[[37, 38, 43, 44], 1] += rng.uniform(0, 9, 4)
+        points[[40, 41, 46, 47], 1] -= rng.uniform(0, 9, 4)
+        points[66, 1] += rng.uniform(0, 25)
+        points[31:36, 0] += rng.uniform(-12, 12)
+        angle = np.deg2rad(rng.uniform(-12, 12))
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        points = points @ rotation.T * rng.uniform(0.8, 1.5) + rng.uniform(200, 800, 2)
+        points += rng.normal(0, 1.0, points.shape)
+        shapes.append(np.round(points))
+    return np.array(shapes)
+
+
+def _processor(**checks):
+    return BiometricImageProcessor(config=Config(), models=_NoModels(), debug_mode=False, **checks)
+
+
+@pytest.mark.parametrize("enabled", [
+    dict.fromkeys(CHECKS, True),
+    {'side_ratio_check': True, 'head_tilt_check': True, 'mouth_check': False, 'eye_check': True},
+    {'side_ratio_check': False, 'head_tilt_check': False, 'mouth_check': True, 'eye_check': True},
+])
+def test_single_and_batch_match_previous_checks(enabled):
+    processor = _processor(**enabled)
+    shapes = _perturbed_shapes()
+    codes, metrics = processor.check_biometric_requirements_batch(shapes)
+    assert codes.shape == (len(shapes),)
+    assert all(metrics[key].shape == (len(shapes),) for key in metrics)
+
+    outcomes = set()
+    for index, points in enumerate(shapes):
+        shape = _Shape(points)
+        expected = _reference_check(shape, processor.config, **enabled)
+        assert processor.check_biometric_requirements(shape) == expected
+        assert processor.check_biometric_requirements(Landmarks.from_shape(shape)) == expected
+        assert processor.check_message(int(codes[index]), metrics, index) == expected
+        outcomes.add(expected[1].split(' ')[0])
+    # Die Stichprobe deckt bestandene und alle aktivierten fehlgeschlagenen Prüfungen ab
+    assert len(outcomes) == 1 + sum(enabled.values())
+
+
+def test_batch_shape_and_single_face_agree():
+    shapes = _perturbed_shapes(count=50, seed=1)
+    thresholds = {'side_ratio_tolerance': 0.15, 'max_head_tilt': 8.0, 'max_mouth_gap': 15, 'min_eye_ratio': 0.2}
+    codes, metrics = check_faces(shapes, **thresholds)
+    assert codes.shape == (50,) and codes.dtype == np.int8
+    for index, points in enumerate(shapes):
+        code, single = check_faces(points, **thresholds)
+        assert np.shape(code) == ()
+        assert int(code) == int(codes[index])
+        for key in metrics:
+            assert single[key] == pytest.approx(metrics[key][index])
+
+
+def test_disabled_checks_always_pass():
+    codes, _ = check_faces(_perturbed_shapes(count=200, seed=2))
+    assert (codes == CHECK_OK).all()
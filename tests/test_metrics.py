@@ -0,0 +1,74 @@
+"""Ablehnungen werden einmal pro Upload gezählt, nicht bei jeder Abfrage des Ergebnisses."""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from config import Config
+from jobs import JobManager
+from metrics import get_metrics
+from pipeline import PipelineError, process_upload
+
+
+def _rejections(reason):
+    line = f'passbild_rejections_total{{reason="{reason}"}} '
+    for row in get_metrics().render().splitlines():
+        if row.startswith(line):
+            return float(row[len(line):])
+    return 0.0
+
+
+def _processor():
+    # Für das Dekodieren genügen Konfiguration und Ziel-Gesichtshöhe, Dlib wird nicht erreicht
+    return SimpleNamespace(config=Config(), target_face_height=480.0)
+
+
+def test_process_upload_counts_each_rejection_once():
+    processor = _processor()
+    before = _rejections('Could not decode image')
+    for _ in range(2):
+        with pytest.raises(PipelineError):
+            process_upload(processor, b'kein Bild')
+    assert _rejections('Could not decode image') == before + 2
+
+
+def test_polling_a_failed_job_does_not_count_again(monkeypatch):
+    pytest.importorskip("dlib")
+    import app as flask_app
+
+    manager = JobManager(lambda data: process_upload(_processor(), data), workers=1)
+    monkeypatch.setattr(flask_app, 'job_manager', manager)
+    client = flask_app.app.test_client()
+    before = _rejections('Could not decode image')
+    job = manager.submit(b'kein Bild')
+    deadline = time.monotonic() + 10
+    while job.finished_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    for _ in range(3):
+        response = client.get(f'/jobs/{job.id}')
+        assert response.get_json()['status'] == 'failed'
+    assert _rejections('Could not decode image') == before + 1
+
+
+def test_each_family_is_one_block_after_its_type_line(monkeypatch):
+    pytest.importorskip("dlib")
+    import app as flask_app
+    from cache import ResultCache
+
+    monkeypatch.setattr(flask_app, 'result_cache', ResultCache(memory_entries=4))
+    body = flask_app.app.test_client().get('/metrics').get_data(as_text=True)
+
+    families, current = [], None
+    for row in body.splitlines():
+        if row.startswith('# TYPE '):
+            current = row.split()[2]
+            assert current not in families, f"{current} mehrfach deklariert"
+            families.append(current)
+        elif row and not row.startswith('#'):
+            name = row.split('{')[0].split(' ')[0]
+            # Histogramme liefern _bucket, _sum und _count zur eigenen Familie
+            assert current is not None and name in (current, current + '_bucket', current + '_sum', current + '_count')
+    assert {'passbild_job_queue_depth', 'passbild_sessions',
+            'passbild_cache_hits_total', 'passbild_cache_misses_total'} <= set(families)
+    assert body.count('# HELP ') == len(families)
@@ -0,0 +1,132 @@
+"""Vorprüfung: gültige Studiofotos bestehen (auch mit Gesicht außerhalb der Mitte), unscharfe und falsch belichtete Bilder nicht."""
+import cv2
+import numpy as np
+import pytest
+
+from config import DEFAULT_CONFIG
+from quality import (QUALITY_BLUR, QUALITY_BRIGHT, QUALITY_DARK, QUALITY_OK, check_quality,
+                     downsample, quality_message, quality_metrics)
+
+
+def _thresholds():
+    # Standardschwellwerte wie in BiometricImageProcessor.check_image_quality (0 = aus)
+    gate = DEFAULT_CONFIG['quality_gate']
+    return {key: gate[key] or None for key in
+            ('min_sharpness', 'max_dark_fraction', 'max_bright_fraction', 'max_background_std')}
+
+
+def _studio_portrait(width=1200, height=1600, head_scale=1.0, background=255, skin=170):
+    """Kopf und Schultern vor einfarbigem Hintergrund, mit scharfen Gesichtsdetails"""
+    image = np.full((height, width), background, np.uint8)
+    cx, cy = width // 2, int(height * 0.42)
+    ax, ay = int(width * 0.2 * head_scale), int(height * 0.2 * head_scale)
+    # Schultern
+    shoulders = np.array([[cx - ax * 2.2, height], [cx - ax * 0.9, cy + ay * 1.2],
+                          [cx + ax * 0.9, cy + ay * 1.2], [cx + ax * 2.2, height]], np.int32)
+    cv2.fillPoly(image, [shoulders], 60)
+    # Haare, Gesicht, Augen, Augenbrauen, Mund
+    cv2.ellipse(image, (cx, cy - ay // 6), (int(ax * 1.08), int(ay * 1.08)), 0, 180, 360, 40, -1)
+    cv2.ellipse(image, (cx, cy), (ax, ay), 0, 0, 360, skin, -1)
+    for side in (-1, 1):
+        eye = (cx + side * ax * 2 // 5, cy - ay // 6)
+        cv2.ellipse(image, eye, (ax // 6, ay // 14), 0, 0, 360, 250, -1)
+        cv2.circle(image, eye, ay // 20, 30, -1)
+        cv2.line(image, (eye[0] - ax // 5, eye[1] - ay // 6), (eye[0] + ax // 5, eye[1] - ay // 6), 50, max(2, ay // 40))
+    cv2.line(image, (cx, cy - ay // 10), (cx - ax // 10, cy + ay // 4), 120, 2)
+    cv2.line(image, (cx - ax // 4, cy + ay // 2), (cx + ax // 4, cy + ay // 2), 90, max(2, ay // 50))
+    # Leichte Hauttextur
+    rng = np.random.default_rng(0)
+    noise = rng.integers(-6, 7, image.shape, dtype=np.int16)
+    mask = image == skin
+    image[mask] = np.clip(image[mask].astype(np.int16) + noise[mask], 0, 255).astype(np.uint8)
+    return image
+
+
+def _code(gray, **overrides):
+    small = downsample(gray, DEFAULT_CONFIG['quality_gate']['max_size'])
+    metrics = quality_metrics(small)
+    return check_quality(metrics, **dict(_thresholds(), **overrides)), metrics
+
+
+@pytest.mark.parametrize("head_scale", [1.0, 0.8, 0.65])
+def test_white_background_portrait_passes(head_scale):
+    code, metrics = _code(_studio_portrait(head_scale=head_scale))
+    assert code == QUALITY_OK, quality_message(code, metrics)[1]
+
+
+def _off_centre(portrait):
+    # Gültiges Porträt in der linken Hälfte eines weißen Querformats
+    frame = np.full((portrait.shape[0], portrait.shape[1] * 2), 255, np.uint8)
+    frame[:, :portrait.shape[1]] = portrait
+    return frame
+
+
+def test_off_centre_portrait_passes():
+    code, metrics = _code(_off_centre(_studio_portrait(width=1200, height=1600)))
+    assert code == QUALITY_OK, quality_message(code, metrics)[1]
+
+
+def test_blurred_off_centre_portrait_is_rejected():
+    blurred = cv2.GaussianBlur(_off_centre(_studio_portrait()), (0, 0), 20)
+    assert _code(blurred)[0] == QUALITY_BLUR
+
+
+def test_light_grey_background_portrait_passes():
+    code, metrics = _code(_studio_portrait(background=235))
+    assert code == QUALITY_OK, quality_message(code, metrics)[1]
+
+
+def test_blurred_portrait_is_rejected():
+    blurred = cv2.GaussianBlur(_studio_portrait(), (0, 0), 20)
+    assert _code(blurred)[0] == QUALITY_BLUR
+
+
+def test_overexposure_check_is_off_by_default():
+    # Ohne Gesichtsposition ist ein überstrahltes Gesicht nicht vom weißen Hintergrund zu unterscheiden
+    assert DEFAULT_CONFIG['quality_gate']['max_bright_fraction'] == 0
+
+
+def test_blown_out_photo_is_rejected_when_enabled():
+    blown_out = np.clip(_studio_portrait().astype(np.int16) + 200, 0, 255).astype(np.uint8)
+    # Ein überstrahltes Bild hat kaum Details; die Belichtung wird hier einzeln geprüft
+    code, metrics = _code(blown_out, min_sharpness=None, max_bright_fraction=0.9)
+    assert code == QUALITY_BRIGHT
+    assert quality_message(code, metrics)[1].startswith("Bild überbelichtet")
+
+
+def test_underexposed_photo_is_rejected():
+    dark = (_studio_portrait().astype(np.float32) * 0.03).astype(np.uint8)
+    # Ein fast schwarzes Bild ist auch unscharf; die Belichtung wird hier einzeln geprüft
+    assert _code(dark)[0] != QUALITY_OK
+    assert _code(dark, min_sharpness=None)[0] == QUALITY_DARK
+
+
+def test_full_resolution_is_downscaled_once_per_request(monkeypatch):
+    pytest.importorskip("dlib")
+    import dlib
+    from config import Config
+    from image_processor import BiometricImageProcessor
+    from pipeline import PROCESSOR_OPTIONS, detect_landmarks
+
+    class NoModels:
+        predictor = None
+        detector = None
+
+    processor = BiometricImageProcessor(config=Config(), models=NoModels(), **PROCESSOR_OPTIONS)
+    seen = []
+    processor.detector = lambda gray, upsample=1: seen.append(gray.shape) or dlib.rectangles()
+
+    image = cv2.cvtColor(_studio_portrait(width=3000, height=4000), cv2.COLOR_GRAY2BGR)
+    full_size_resizes = []
+    resize = cv2.resize
+
+    def counting_resize(src, *args, **kwargs):
+        if src.shape[:2] == image.shape[:2]:
+            full_size_resizes.append(src.shape)
+        return resize(src, *args, **kwargs)
+
+    monkeypatch.setattr(cv2, 'resize', counting_resize)
+    assert detect_landmarks(processor, image) is None
+    # Vorprüfung und Erkennung nutzen dieselbe Kopie; der Rückfall läuft danach auf voller Auflösung
+    assert len(full_size_resizes) == 1
+    assert seen[0] == (1000, 750)
@@ -0,0 +1,64 @@
+"""Anpassungssitzungen: Vorschau aus der Bildpyramide und Prüfung der Tasten."""
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from geometry import level_transform, warp_window
+from pipeline import PipelineError
+from sessions import Session
+
+
+def _textured_image(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    return cv2.GaussianBlur(cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC), (0, 0), 2)
+
+
+def _shift(a, b):
+    gray_a = cv2.cvtColor(a, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    gray_b = cv2.cvtColor(b, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    (dx, dy), _ = cv2.phaseCorrelate(gray_a, gray_b)
+    return float(np.hypot(dx, dy))
+
+
+@pytest.mark.parametrize("levels, scale", [(1, 0.5), (2, 0.25), (2, 0.22)])
+def test_pyramid_level_matches_full_resolution_window(levels, scale):
+    image = _textured_image(1600, 2000)
+    level = image
+    for _ in range(levels):
+        level = cv2.pyrDown(level)
+    factor = 0.5 ** levels
+    angle = np.deg2rad(3.0)
+    matrix = np.array([[scale * np.cos(angle), -scale * np.sin(angle), -37.3],
+                       [scale * np.sin(angle), scale * np.cos(angle), -61.8]])
+
+    reference = warp_window(image, matrix, (320, 400), interpolation=cv2.INTER_LINEAR)
+    preview = warp_window(level, level_transform(matrix, factor), (320, 400), interpolation=cv2.INTER_LINEAR)
+    assert _shift(reference, preview) < 0.1
+
+
+def _session():
+    image = np.zeros((8, 8, 3), np.uint8)
+    return Session(image, 1, None, [(1.0, image)])
+
+
+def _processor():
+    return SimpleNamespace(move_step=10, after_scale_factor=1.05, rotate_angle=1.0)
+
+
+@pytest.mark.parametrize("keys", ['left', ['left', 'up', 'x'], ['+', None], {'keys': 'left'}])
+def test_invalid_keys_leave_the_session_unchanged(keys):
+    session = _session()
+    before = session.adjustments()
+    with pytest.raises(PipelineError):
+        session.apply_keys(_processor(), keys)
+    assert session.adjustments() == before
+
+
+def test_valid_keys_are_applied_in_order():
+    session = _session()
+    session.apply_keys(_processor(), ['left', 'left', 'down', '+', 'l'])
+    assert session.adjustments() == {'scale_override': 1.05, 'offset_x': -20, 'offset_y': 10,
+                                     'rotation_angle': 1.0}